@@ -1,20 +1,64 @@
-from datetime import datetime, date, timedelta
+import multiprocessing
+
+if __name__ == "__main__":
+    # No executável (PyInstaller) cada processo de relatório roda este mesmo
+    # programa: freeze_support o desvia para o relatório antes de subir o servidor
+    multiprocessing.freeze_support()
+
+from datetime import datetime
 import io
-from flask import Flask, jsonify, render_template, request, redirect, send_file, url_for, session
+import shutil
+import tempfile
+import click
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, send_file, send_from_directory, stream_with_context, url_for, session
 from flask_login import LoginManager, current_user, login_required, login_user, logout_user
 from fpdf import FPDF
-from models import FechamentoCaixa, Transacao, db, Usuario, Categoria, Produto, ItemTransacao
+from sqlalchemy import inspect
+from sqlalchemy.orm import undefer
+from sqlalchemy.orm.exc import StaleDataError
+from config import Config
+from models import FechamentoCaixa, Transacao, db, Usuario, Categoria, Produto
 
 from utils import gerar_pdf
+from utils.alteracao_em_massa import AlteracaoInvalida, ajustar_estoque_em_massa, reajustar_precos
+from utils.auditoria import filtros_auditoria, pagina_atividades, registro_auditoria
+from utils.banco import configurar_banco, engine_leitura
+from utils.gerar_pdf import gerar_pdf_stream
+from utils.busca_produtos import LIMITE_BUSCA, buscar_produtos
+from utils.catalogo import buscar_por_codigo, cache_produtos, configurar_cache, geracao_catalogo, guardar_produto, invalidar_catalogo, invalidar_produto
+from utils.dinheiro import ProvedorJSON, para_decimal
+from utils.estaticos import configurar_estaticos
+from utils.estoque import ajustar_estoque, consolidador_estoque, consolidar_movimentos, historico_estoque, registrar_movimento
+from utils.exportacao import FORMATOS
+from utils.idempotencia import TAMANHO_CHAVE, limpar_chaves_expiradas, limpeza_idempotencia, resposta_gravada
+from utils.historico import LIMITE_PAGINA, filtros_periodo, invalidar_totais, pagina_transacoes, totais_periodo
+from utils.imagens import eh_nome_por_hash, imagem_para_exibir, salvar_imagem
+from utils.importacao import ImportacaoInvalida, importar_produtos
+from utils.impressao import fila_impressao
+from utils.indices import verificar_planos
+from utils.migracao_centavos import migrar_para_centavos
+from utils.relatorios import linhas_relatorio, parametros_relatorio
+from utils.resumos import reconstruir_resumos
+from utils.sincronizacao import LIMITE_LOTE, LoteInvalido, sincronizar_vendas
+from utils.tarefas_relatorio import caminho_arquivo, configurar_tarefas, situacao, submeter
+from utils.turno import fechar_turno, totais_por_metodo, turno_aberto, verificar_turno
+from utils.usuarios import cache_usuarios, carregar_usuario, configurar_cache_usuarios, invalidar_usuario
+from utils.venda import ConflitoVenda, VendaInvalida, conferir_pagamento, registrar_venda, resposta_venda
 from werkzeug.security import check_password_hash, generate_password_hash
-from werkzeug.utils import secure_filename
 import os
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///smartcaixa.db'
-app.config['SECRET_KEY'] = 'Ayce'
-app.config['UPLOAD_FOLDER'] = 'static/imagens'
-db.init_app(app)
+app.config.from_object(Config)
+app.json = ProvedorJSON(app)
+configurar_banco(app)
+configurar_cache(app)
+configurar_cache_usuarios(app)
+configurar_estaticos(app)
+configurar_tarefas(app)
+fila_impressao.configurar(app)
+consolidador_estoque.configurar(app)
+limpeza_idempotencia.configurar(app)
+registro_auditoria.configurar(app)
 
 # Configurar Flask-Login
 login_manager = LoginManager()
@@ -23,7 +67,44 @@ login_manager.login_view = 'index'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return carregar_usuario(user_id)
+
+@app.before_request
+def iniciar_tarefas_periodicas():
+    # Só quem atende requisições roda as tarefas periódicas: nunca um comando
+    # do CLI (converter-centavos refaz tabelas) nem o processo do reloader
+    consolidador_estoque.iniciar()
+    limpeza_idempotencia.iniciar()
+
+@app.before_request
+def encerrar_sessao_removida():
+    # Usuário excluído: o load_user não o encontra mais e a sessão é encerrada
+    if 'usuario' in session and not current_user.is_authenticated:
+        session.pop('usuario', None)
+
+def pasta_imagens():
+    return os.path.join(app.root_path, app.config['UPLOAD_FOLDER'])
+
+@app.context_processor
+def utilitarios_imagem():
+    def url_imagem(nome, largura=None):
+        if not nome:
+            return url_for('static', filename='imagens/sem-imagem.png')
+        return url_for('imagem_produto', nome=imagem_para_exibir(nome, pasta_imagens(), largura))
+    return {'url_imagem': url_imagem}
+
+@app.route('/imagens/<path:nome>')
+def imagem_produto(nome):
+    nome = os.path.basename(nome)
+    if not nome or nome.startswith('.'):
+        abort(404)
+    # Nome pelo hash do conteúdo nunca muda de conteúdo: o navegador guarda por um ano
+    imutavel = eh_nome_por_hash(nome)
+    resposta = send_from_directory(pasta_imagens(), nome, max_age=31536000 if imutavel else 3600)
+    if imutavel:
+        resposta.cache_control.public = True
+        resposta.cache_control.immutable = True
+    return resposta
 
 @app.route('/')
 def index():
@@ -39,12 +120,15 @@ def login():
     if user and check_password_hash(user.senha, senha):
         login_user(user)
         session['usuario'] = usuario
+        registro_auditoria.registrar('Login', usuario)
         return redirect(url_for('pdv'))
+    registro_auditoria.registrar('Falha de login', usuario)
     return 'Usuário ou senha inválidos', 401
 
 @app.route('/logout')
 @login_required
 def logout():
+    registro_auditoria.registrar('Logout')
     logout_user()
     session.pop('usuario', None)
     return redirect(url_for('index'))
@@ -64,43 +148,71 @@ def finalizar_compra():
     pagamento = dados.get('pagamento')
     valor_recebido = dados.get('valor_recebido')
     imprimir_nota = dados.get('imprimir_nota', False)
-    
-    if not carrinho:
-        return jsonify({'status': 'error', 'message': 'Carrinho vazio!'}), 400
-    
-    total = sum(item['preco'] * item['quantidade'] for item in carrinho)
-    troco = valor_recebido - total
-
-    if pagamento == 'dinheiro' and troco < 0:
-        return jsonify({'status': 'error', 'message': 'Valor recebido insuficiente!'}), 400
-
-    for item in carrinho:
-        produto = Produto.query.get(item['id'])
-        if produto:
-            produto.estoque -= item['quantidade']
-            if produto.estoque < 0:
-                return jsonify({'status': 'error', 'message': f'Estoque insuficiente para {produto.nome}!'}), 400
-            db.session.add(produto)
-    
-    nova_transacao = Transacao(
-        data=datetime.now(),
-        valor=total,
-        metodo_pagamento=pagamento
-    )
-    db.session.add(nova_transacao)
-    db.session.commit()
-    
-    for item in carrinho:
-        item_transacao = ItemTransacao(
-            produto_id=item['id'],
-            quantidade=item['quantidade'],
-            preco=item['preco'],
-            transacao=nova_transacao
+
+    # Duplo clique ou fetch reenviado: a mesma chave devolve a venda já gravada
+    chave = request.headers.get('Idempotency-Key') or None
+    if chave is not None:
+        if len(chave) > TAMANHO_CHAVE:
+            return jsonify({'status': 'error', 'message': 'Chave de idempotência inválida!'}), 400
+        gravada = resposta_gravada(chave)
+        if gravada is not None:
+            return responder_gravada(gravada)
+
+    try:
+        total = conferir_pagamento(carrinho, pagamento, valor_recebido)
+        transacao_id = registrar_venda(carrinho, pagamento, chave)
+    except VendaInvalida as e:
+        # O outro envio pode ter gravado a venda enquanto esta rodava
+        gravada = resposta_gravada(chave) if chave else None
+        if gravada is not None:
+            return responder_gravada(gravada)
+        return jsonify({'status': 'error', 'message': str(e)}), 409 if isinstance(e, ConflitoVenda) else 400
+
+    registro_auditoria.registrar(f'Venda #{transacao_id}: R$ {total} ({pagamento})', session['usuario'])
+
+    # A impressão roda em segundo plano; a resposta não espera a impressora
+    if imprimir_nota:
+        fila_impressao.enfileirar(transacao_id)
+
+    return jsonify(resposta_venda(transacao_id)), 200
+
+def responder_gravada(gravada):
+    resultado, status_code = gravada
+    resposta = jsonify(resultado)
+    resposta.headers['Idempotent-Replayed'] = 'true'
+    return resposta, status_code
+
+@app.route('/sincronizar_vendas', methods=['POST'])
+@login_required
+def sincronizar_vendas_terminal():
+    dados = request.get_json(silent=True) or {}
+    try:
+        resultados = sincronizar_vendas(dados.get('vendas'))
+    except LoteInvalido as e:
+        return jsonify({'status': 'error', 'message': str(e), 'limite': LIMITE_LOTE}), 400
+
+    novas = [resultado for resultado in resultados if not resultado['repetida']]
+    if novas:
+        vendas = [f"#{resultado['transacao_id']}" for resultado in novas if resultado['status'] == 'success']
+        registro_auditoria.registrar(
+            f"Vendas offline sincronizadas: {len(vendas)} gravadas, {len(novas) - len(vendas)} recusadas "
+            f"({', '.join(vendas)})"
         )
-        db.session.add(item_transacao)
-    
-    db.session.commit()
-    return jsonify({'status': 'success', 'message': 'Compra finalizada com sucesso!'}), 200
+
+    if dados.get('imprimir_nota'):
+        for resultado in resultados:
+            if resultado['status'] == 'success' and not resultado['repetida']:
+                fila_impressao.enfileirar(resultado['transacao_id'])
+
+    return jsonify({'status': 'success', 'resultados': resultados}), 200
+
+@app.route('/impressao/<int:transacao_id>')
+@login_required
+def situacao_impressao(transacao_id):
+    situacao = fila_impressao.situacao(transacao_id)
+    if situacao is None:
+        return jsonify({'status': 'error', 'message': 'Nenhuma impressão para esta venda.'}), 404
+    return jsonify(situacao)
     
     
 
@@ -119,13 +231,14 @@ def add_categoria():
     nova_categoria = Categoria(nome=nome_categoria)
     db.session.add(nova_categoria)
     db.session.commit()
+    registro_auditoria.registrar(f'Categoria criada: {nome_categoria}', session['usuario'])
     return redirect(url_for('categorias'))
 
 @app.route('/produtos')
 def produtos():
     if 'usuario' not in session:
         return redirect(url_for('index'))
-    produtos = Produto.query.all()
+    produtos = Produto.query.options(undefer(Produto.estoque_disponivel)).all()
     categorias = Categoria.query.all()
     return render_template('produtos.html', produtos=produtos, categorias=categorias)
 
@@ -139,33 +252,106 @@ def add_produto():
     preco_produto = request.form['preco_produto']
     estoque_produto = request.form['estoque_produto']
     categoria_id = request.form['categoria_id']
+    try:
+        preco_produto = para_decimal(preco_produto)
+    except ArithmeticError:
+        preco_produto = None
+    if preco_produto is None or not preco_produto.is_finite() or preco_produto < 0:
+        return "Preço inválido.", 400
+    try:
+        estoque_produto = int(estoque_produto)
+    except ValueError:
+        estoque_produto = -1
+    if estoque_produto < 0:
+        return "Quantidade em estoque inválida. Informe um número inteiro maior ou igual a zero.", 400
     
-    imagem_produto = request.files['imagem_produto']
-    imagem_path = None
-    if imagem_produto:
-        imagem_filename = secure_filename(imagem_produto.filename)
-        imagem_path = os.path.join(app.config['UPLOAD_FOLDER'], imagem_filename)
-        imagem_produto.save(imagem_path)
+    imagem_produto = request.files.get('imagem_produto')
+    imagem_nome = None
+    if imagem_produto and imagem_produto.filename:
+        imagem_nome = salvar_imagem(imagem_produto, pasta_imagens())
     
     novo_produto = Produto(
         nome=nome_produto,
         descricao=descricao_produto,
         codigo_barras=codigo_barras,
         preco=preco_produto,
-        estoque=estoque_produto,
-        imagem=imagem_path,
+        estoque=0,
+        imagem=imagem_nome,
         categoria_id=categoria_id
     )
     db.session.add(novo_produto)
+    db.session.flush()
+    # O estoque inicial entra no livro como a primeira entrada do produto
+    if estoque_produto:
+        registrar_movimento(novo_produto.id, estoque_produto, 'entrada')
     db.session.commit()
+    guardar_produto(novo_produto)
+    registro_auditoria.registrar(f'Produto criado: {codigo_barras} {nome_produto} (estoque {estoque_produto})', session['usuario'])
     return redirect(url_for('produtos'))
 
+@app.route('/importar_produtos', methods=['POST'])
+@login_required
+def importar_produtos_csv():
+    arquivo = request.files.get('arquivo')
+    if not arquivo or not arquivo.filename:
+        return jsonify({'status': 'error', 'message': 'Envie um arquivo CSV.'}), 400
+
+    # O upload é lido em fluxo, sem carregar o arquivo inteiro na memória. O
+    # werkzeug guarda o upload num SpooledTemporaryFile, que só ganhou
+    # readable() no Python 3.11: o TextIOWrapper lê de um arquivo temporário
+    with tempfile.TemporaryFile() as temporario:
+        shutil.copyfileobj(arquivo.stream, temporario)
+        temporario.seek(0)
+        texto = io.TextIOWrapper(temporario, encoding='utf-8-sig', newline='')
+        try:
+            resumo = importar_produtos(texto, criar_categorias=request.form.get('criar_categorias') in ('1', 'on', 'true'))
+        except ImportacaoInvalida as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+    registro_auditoria.registrar(
+        f"Importação de produtos ({arquivo.filename}): {resumo['inseridos']} inseridos, "
+        f"{resumo['atualizados']} atualizados, {resumo['total_erros']} linhas com erro"
+    )
+    return jsonify(dict(resumo, status='success')), 200
+
+# Alterações em massa: um UPDATE (ou INSERT ... SELECT no livro de estoque)
+# para todos os produtos do filtro; com "simular" devolvem só a prévia
+@app.route('/produtos/reajuste_precos', methods=['POST'])
+@login_required
+def reajuste_precos():
+    dados = request.get_json(silent=True) or {}
+    try:
+        resultado = reajustar_precos(dados.get('filtro'), dados.get('tipo'), dados.get('valor'),
+                                     usuario=current_user.usuario, simular=bool(dados.get('simular')))
+    except AlteracaoInvalida as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(dict(resultado, status='success')), 200
+
+@app.route('/produtos/ajuste_estoque', methods=['POST'])
+@login_required
+def ajuste_estoque():
+    dados = request.get_json(silent=True) or {}
+    try:
+        resultado = ajustar_estoque_em_massa(dados.get('filtro'), dados.get('tipo'), dados.get('quantidade'),
+                                             usuario=current_user.usuario, simular=bool(dados.get('simular')))
+    except AlteracaoInvalida as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(dict(resultado, status='success')), 200
+
+MENSAGEM_CONFLITO_PRODUTO = 'O produto foi alterado por outro usuário. Recarregue a página e tente novamente.'
+
 @app.route('/edit_produto/<int:produto_id>', methods=['POST'])
 def edit_produto(produto_id):
     if 'usuario' not in session:
         return redirect(url_for('index'))
     
-    produto = Produto.query.get_or_404(produto_id)
+    produto = Produto.query.options(undefer(Produto.estoque_disponivel)).get_or_404(produto_id)
+    codigo_barras_antigo = produto.codigo_barras
+
+    # O formulário leva a versão e o estoque que o usuário viu: se outro
+    # terminal alterou o produto desde então, nada é sobrescrito
+    versao = request.form.get('versao', type=int)
+    if versao is not None and versao != produto.versao:
+        return MENSAGEM_CONFLITO_PRODUTO, 409
     
     # Obtendo valores do formulário e garantindo que não sejam None
     nome_produto = request.form.get('nome_produto')
@@ -174,6 +360,7 @@ def edit_produto(produto_id):
     preco_produto = request.form.get('preco_produto')
     estoque_produto = request.form.get('estoque_produto')
     categoria_id = request.form.get('categoria_id')
+    ajuste = None
     
     # Verificando se os valores não são vazios
     if nome_produto:
@@ -183,26 +370,59 @@ def edit_produto(produto_id):
     if codigo_barras:
         produto.codigo_barras = codigo_barras
     if preco_produto:
-        produto.preco = preco_produto
+        try:
+            preco = para_decimal(preco_produto)
+        except ArithmeticError:
+            preco = None
+        if preco is None or not preco.is_finite() or preco < 0:
+            return "Preço inválido.", 400
+        produto.preco = preco
     if estoque_produto:
-        produto.estoque = estoque_produto
+        # A quantidade informada é uma contagem: a diferença vira um ajuste no livro.
+        # Só ajusta se o usuário mudou o número, e só se o saldo ainda é o que ele viu
+        try:
+            contagem = int(estoque_produto)
+        except ValueError:
+            contagem = -1
+        if contagem < 0:
+            return "Quantidade em estoque inválida. Informe um número inteiro maior ou igual a zero.", 400
+        estoque_anterior = request.form.get('estoque_anterior', type=int)
+        if estoque_anterior is None:
+            ajuste = ajustar_estoque(produto, contagem)
+        elif contagem != estoque_anterior:
+            if produto.estoque_disponivel != estoque_anterior:
+                return MENSAGEM_CONFLITO_PRODUTO, 409
+            ajuste = ajustar_estoque(produto, contagem)
     if categoria_id:
-        produto.categoria_id = categoria_id
+        produto.categoria_id = int(categoria_id)
     
     imagem_produto = request.files.get('imagem_produto')
     if imagem_produto and imagem_produto.filename:
-        imagem_filename = secure_filename(imagem_produto.filename)
-        imagem_produto.save(os.path.join(app.config['UPLOAD_FOLDER'], imagem_filename))
-        produto.imagem = imagem_filename
+        imagem_nome = salvar_imagem(imagem_produto, pasta_imagens())
+        if imagem_nome:
+            produto.imagem = imagem_nome
+
+    # Guardado antes do commit, que zera o histórico dos atributos
+    alterados = [atributo.key for atributo in inspect(produto).attrs if atributo.history.has_changes()]
+    if ajuste is not None:
+        alterados.append(f'estoque {ajuste.quantidade:+}')
 
     try:
         db.session.commit()
+    except StaleDataError:
+        # Outro terminal gravou o produto entre a leitura e o UPDATE (versão mudou)
+        db.session.rollback()
+        return MENSAGEM_CONFLITO_PRODUTO, 409
     except Exception as e:
         db.session.rollback()
         # Adicione um log ou um tratamento de erro aqui se necessário
         print(f"Erro ao atualizar o produto: {e}")
         return redirect(url_for('produtos', error="Erro ao atualizar o produto"))
     
+    invalidar_produto(produto_id, codigo_barras_antigo)
+    if alterados:
+        registro_auditoria.registrar(f"Produto editado: #{produto_id} {produto.codigo_barras} ({', '.join(alterados)})",
+                                     session['usuario'])
     return redirect(url_for('produtos'))
 
 
@@ -210,36 +430,27 @@ def edit_produto(produto_id):
 @app.route('/transacoes')
 def transacoes():
     filtro = request.args.get('filtro', 'hoje')
-    pagina = int(request.args.get('page', 1))
-    limite = 200  # Número de transações por página
-
-    # Filtra transações com base no filtro (hoje, semana, mês)
-    if filtro == 'hoje':
-        transacoes_query = Transacao.query.filter(Transacao.data >= date.today())
-    elif filtro == 'semana':
-        start_date = date.today() - timedelta(days=date.today().weekday())
-        transacoes_query = Transacao.query.filter(Transacao.data >= start_date)
-    elif filtro == 'mes':
-        start_date = date.today().replace(day=1)
-        transacoes_query = Transacao.query.filter(Transacao.data >= start_date)
-    else:
-        transacoes_query = Transacao.query
-
-    # Contar total de transações para paginação
-    total_transacoes = transacoes_query.count()
-    
-    # Paginando os resultados
-    transacoes_detalhadas = transacoes_query.paginate(page=pagina, per_page=limite)
+    pagina = request.args.get('page', 1, type=int)
+
+    # Paginação por cursor: ?apos= avança para as mais antigas e ?antes= volta
+    transacoes_detalhadas, cursor_anterior, cursor_proximo = pagina_transacoes(
+        filtros_periodo(filtro),
+        apos=request.args.get('apos'),
+        antes=request.args.get('antes'),
+        limite=LIMITE_PAGINA
+    )
 
-    # Calculando o total dos valores
-    total = sum(t.valor for t in transacoes_detalhadas.items)
+    # Quantidade e soma de todo o período filtrado (agregação em cache)
+    total_transacoes, total = totais_periodo(filtro)
 
     return render_template('transacoes.html', 
-                           transacoes_detalhadas=transacoes_detalhadas.items, 
+                           transacoes_detalhadas=transacoes_detalhadas, 
                            filtro=filtro,
                            pagina=pagina,
+                           cursor_anterior=cursor_anterior,
+                           cursor_proximo=cursor_proximo,
                            total_transacoes=total_transacoes,
-                           limite=limite,
+                           limite=LIMITE_PAGINA,
                            total=total)
 
 
@@ -248,60 +459,49 @@ def fechamento():
     if 'usuario' not in session:
         return redirect(url_for('index'))
 
+    turno = turno_aberto()
+
     if request.method == 'POST':
-        abertura = request.form.get('abertura')
         fechamento = datetime.now()
-        fundo_caixa = float(request.form.get('fundo_caixa', 0))
+        fundo_caixa = para_decimal(request.form.get('fundo_caixa') or 0)
         usuario_id = Usuario.query.filter_by(usuario=session['usuario']).first().id
-
-        try:
-            abertura_datetime = datetime.strptime(abertura, '%Y-%m-%dT%H:%M')
-        except ValueError:
-            return "Formato de data e hora inválido. Use o formato 'YYYY-MM-DDTHH:MM'.", 400
+        divergencias = None
+
+        if turno:
+            # Totais já acumulados pelo checkout: fechar é só ler e congelar
+            abertura_datetime = turno.abertura
+            totais = fechar_turno(turno, fechamento)
+            if request.form.get('verificar'):
+                divergencias = verificar_turno(turno, totais)
+        else:
+            abertura = request.form.get('abertura')
+            try:
+                abertura_datetime = datetime.strptime(abertura, '%Y-%m-%dT%H:%M')
+            except (TypeError, ValueError):
+                return "Formato de data e hora inválido. Use o formato 'YYYY-MM-DDTHH:MM'.", 400
+            totais = totais_por_metodo(abertura_datetime, fechamento)
 
         fechamento_caixa = FechamentoCaixa(
             abertura=abertura_datetime,
             fechamento=fechamento,
             fundo_caixa=fundo_caixa,
+            total_pix=totais['pix'],
+            total_debito=totais['debito'],
+            total_credito=totais['credito'],
+            total_dinheiro=totais['dinheiro'],
             usuario_id=usuario_id
         )
         db.session.add(fechamento_caixa)
         db.session.commit()
+        registro_auditoria.registrar(
+            f"Fechamento de caixa #{fechamento_caixa.id}: {abertura_datetime:%d/%m/%Y %H:%M} a {fechamento:%d/%m/%Y %H:%M}"
+            + (f" ({len(divergencias)} divergência(s))" if divergencias else ''),
+            session['usuario']
+        )
 
-        total_pix = db.session.query(db.func.sum(Transacao.valor)).filter(
-            Transacao.metodo_pagamento == 'pix',
-            Transacao.data >= abertura_datetime,
-            Transacao.data <= fechamento
-        ).scalar() or 0
-
-        total_debito = db.session.query(db.func.sum(Transacao.valor)).filter(
-            Transacao.metodo_pagamento == 'debito',
-            Transacao.data >= abertura_datetime,
-            Transacao.data <= fechamento
-        ).scalar() or 0
-
-        total_credito = db.session.query(db.func.sum(Transacao.valor)).filter(
-            Transacao.metodo_pagamento == 'credito',
-            Transacao.data >= abertura_datetime,
-            Transacao.data <= fechamento
-        ).scalar() or 0
-
-        total_dinheiro = db.session.query(db.func.sum(Transacao.valor)).filter(
-            Transacao.metodo_pagamento == 'dinheiro',
-            Transacao.data >= abertura_datetime,
-            Transacao.data <= fechamento
-        ).scalar() or 0
-
-        fechamento_caixa.total_pix = total_pix
-        fechamento_caixa.total_debito = total_debito
-        fechamento_caixa.total_credito = total_credito
-        fechamento_caixa.total_dinheiro = total_dinheiro
-
-        db.session.commit()
-
-        return render_template('fechamento.html', fechamento=fechamento_caixa)
+        return render_template('fechamento.html', fechamento=fechamento_caixa, divergencias=divergencias)
 
-    return render_template('fechamento.html')
+    return render_template('fechamento.html', turno=turno)
 
 @app.route('/configuracoes')
 def configuracoes():
@@ -320,6 +520,8 @@ def add_usuario():
     novo_usuario = Usuario(usuario=usuario, senha=senha_hash, nivel_acesso=nivel_acesso)
     db.session.add(novo_usuario)
     db.session.commit()
+    invalidar_usuario(novo_usuario.id)
+    registro_auditoria.registrar(f'Usuário criado: {usuario} ({nivel_acesso})')
     
     return redirect(url_for('configuracoes'))
 
@@ -330,8 +532,11 @@ def delete_usuario():
     usuario = Usuario.query.get(usuario_id)
     
     if usuario:
+        nome_usuario = usuario.usuario
         db.session.delete(usuario)
         db.session.commit()
+        invalidar_usuario(usuario_id)
+        registro_auditoria.registrar(f'Usuário removido: {nome_usuario}')
     
     return redirect(url_for('configuracoes'))
 
@@ -342,21 +547,43 @@ def gerar_relatorio():
     if 'usuario' not in session:
         return redirect(url_for('index'))
     
-    # Obtém todas as transações
-    transacoes = Transacao.query.all()
-    
-    # Prepara o resumo das transações
-    resumo = [f"{t.data} - {t.valor} - {t.metodo_pagamento}" for t in transacoes]
-    
-    # Gera o PDF e obtém o conteúdo em memória
-    pdf_content = gerar_pdf(resumo)
-    
-    # Envia o PDF como resposta para download
-    return send_file(
-        pdf_content,
-        as_attachment=True,
-        download_name='relatorio_transacoes.pdf',
-        mimetype='application/pdf'
+    try:
+        parametros = parametros_relatorio(request.form)
+    except ValueError:
+        return "Formato de data inválido. Use o formato 'YYYY-MM-DD'.", 400
+
+    # As transações são lidas em lotes e cada página do PDF é enviada assim que fica pronta
+    def gerar():
+        with engine_leitura().connect() as conexao:
+            yield from gerar_pdf_stream(linhas_relatorio(conexao, **parametros))
+
+    return Response(
+        stream_with_context(gerar()),
+        mimetype='application/pdf',
+        headers={'Content-Disposition': 'attachment; filename=relatorio_transacoes.pdf'}
+    )
+
+@app.route('/exportar/transacoes.<formato>', methods=['GET'])
+@login_required
+def exportar_transacoes(formato):
+    if formato not in FORMATOS:
+        return jsonify({'status': 'error', 'message': 'Formato inválido. Use csv ou ndjson.'}), 404
+    try:
+        filtros = parametros_relatorio(request.args)
+    except ValueError:
+        return "Formato de data inválido. Use o formato 'YYYY-MM-DD'.", 400
+
+    exportar, content_type = FORMATOS[formato]
+
+    # Uma linha por item vendido, lida e enviada em lotes
+    def gerar():
+        with engine_leitura().connect() as conexao:
+            yield from exportar(conexao, **filtros)
+
+    return Response(
+        stream_with_context(gerar()),
+        content_type=content_type,
+        headers={'Content-Disposition': f'attachment; filename=transacoes.{formato}'}
     )
 
 def gerar_pdf(dados):
@@ -379,29 +606,109 @@ def search_produto():
     if 'usuario' not in session:
         return redirect(url_for('index'))
     query = request.args.get('query', '')
-    produtos = Produto.query.filter(
-        Produto.nome.ilike(f'%{query}%') | Produto.codigo_barras.ilike(f'%{query}%')
-    ).all()
-    produtos_list = [{'id': p.id, 'nome': p.nome, 'descricao': p.descricao, 'codigo_barras': p.codigo_barras, 'preco': p.preco, 'estoque': p.estoque} for p in produtos]
+
+    # Leitura do scanner: código de barras exato já em cache não vai ao banco
+    produto = buscar_por_codigo(query)
+    if produto is not None:
+        return jsonify([produto])
+
+    limite = request.args.get('limite', LIMITE_BUSCA, type=int)
+    geracao = geracao_catalogo()
+    produtos_list = buscar_produtos(query, limite)
+    for dados in produtos_list:
+        if dados['codigo_barras'] == query:
+            guardar_produto(dados, geracao)
     return jsonify(produtos_list)
 
+@app.route('/produto/barcode/<codigo>', methods=['GET'])
+def produto_por_codigo_barras(codigo):
+    if 'usuario' not in session:
+        return redirect(url_for('index'))
 
+    dados = buscar_por_codigo(codigo)
+    if dados is None:
+        geracao = geracao_catalogo()
+        produto = Produto.query.options(undefer(Produto.estoque_disponivel)).filter_by(codigo_barras=codigo).first()
+        if produto is None:
+            return jsonify({'status': 'error', 'message': 'Produto não encontrado!'}), 404
+        dados = guardar_produto(produto, geracao)
+
+    # Estoque e preço mudam: o navegador revalida sempre e recebe 304 se nada mudou
+    response = jsonify(dados)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/estoque/<int:produto_id>/movimentos')
+@login_required
+def movimentos_estoque(produto_id):
+    produto = Produto.query.options(undefer(Produto.estoque_disponivel)).get_or_404(produto_id)
+    limite = min(request.args.get('limite', 100, type=int), 1000)
+    return jsonify({
+        'produto_id': produto.id,
+        'estoque_consolidado': produto.estoque,
+        'estoque_disponivel': produto.estoque_disponivel,
+        'movimentos': [{
+            'id': movimento.id,
+            'data': movimento.data.isoformat(sep=' '),
+            'tipo': movimento.tipo,
+            'quantidade': movimento.quantidade,
+            'transacao_id': movimento.transacao_id,
+            'consolidado': movimento.consolidado,
+        } for movimento in historico_estoque(produto.id, limite)]
+    })
+
+@app.route('/auditoria')
+@login_required
+def auditoria():
+    if not current_user.is_admin:
+        return redirect(url_for('pdv'))
+    usuario = request.args.get('usuario') or None
+    texto = request.args.get('texto') or None
+    try:
+        inicio = datetime.strptime(request.args['inicio'], '%Y-%m-%d') if request.args.get('inicio') else None
+        fim = datetime.strptime(request.args['fim'], '%Y-%m-%d') if request.args.get('fim') else None
+    except ValueError:
+        return "Formato de data inválido. Use o formato 'YYYY-MM-DD'.", 400
+
+    atividades, cursor_anterior, cursor_proximo = pagina_atividades(
+        filtros_auditoria(usuario=usuario, texto=texto, inicio=inicio, fim=fim),
+        apos=request.args.get('apos'),
+        antes=request.args.get('antes'),
+    )
+    filtros = {
+        'usuario': usuario or '',
+        'texto': texto or '',
+        'inicio': request.args.get('inicio', ''),
+        'fim': request.args.get('fim', ''),
+    }
+    return render_template('auditoria.html', atividades=atividades, filtros=filtros,
+                           cursor_anterior=cursor_anterior, cursor_proximo=cursor_proximo,
+                           usuarios=Usuario.query.order_by(Usuario.usuario).all(),
+                           fila=registro_auditoria.estatisticas())
+
+@app.route('/cache/produtos')
+@login_required
+def estatisticas_cache_produtos():
+    return jsonify(cache_produtos.estatisticas())
 
-@app.route('/gerar_pdf_fechamento', methods=['POST'])
+@app.route('/cache/usuarios')
 @login_required
-def gerar_pdf_fechamento():
-    if 'usuario' not in session:
-        return redirect(url_for('index'))
-    
-    abertura = request.form.get('abertura')
-    fechamento = request.form.get('fechamento')
-    total_pix = float(request.form.get('total_pix', 0))
-    total_debito = float(request.form.get('total_debito', 0))
-    total_credito = float(request.form.get('total_credito', 0))
-    total_dinheiro = float(request.form.get('total_dinheiro', 0))
-    fundo_caixa = float(request.form.get('fundo_caixa', 0))
-
-    dados = [
+def estatisticas_cache_usuarios():
+    return jsonify(cache_usuarios.estatisticas())
+
+
+
+def dados_fechamento(form):
+    abertura = form.get('abertura')
+    fechamento = form.get('fechamento')
+    total_pix = para_decimal(form.get('total_pix') or 0)
+    total_debito = para_decimal(form.get('total_debito') or 0)
+    total_credito = para_decimal(form.get('total_credito') or 0)
+    total_dinheiro = para_decimal(form.get('total_dinheiro') or 0)
+    fundo_caixa = para_decimal(form.get('fundo_caixa') or 0)
+
+    return [
         f"Data e Hora de Abertura: {abertura}",
         f"Data e Hora de Fechamento: {fechamento}",
         f"Fundo de Caixa: R$ {fundo_caixa:.2f}",
@@ -411,6 +718,14 @@ def gerar_pdf_fechamento():
         f"Total Dinheiro: R$ {total_dinheiro:.2f}",
     ]
 
+@app.route('/gerar_pdf_fechamento', methods=['POST'])
+@login_required
+def gerar_pdf_fechamento():
+    if 'usuario' not in session:
+        return redirect(url_for('index'))
+    
+    dados = dados_fechamento(request.form)
+
     pdf_content = gerar_pdf(dados)
     
     return send_file(
@@ -420,6 +735,110 @@ def gerar_pdf_fechamento():
         mimetype='application/pdf'
     )
 
+# Relatórios gerados em segundo plano: envia, acompanha e baixa
+@app.route('/relatorios', methods=['POST'])
+@login_required
+def submeter_relatorio():
+    tipo = request.form.get('tipo', 'transacoes')
+    if tipo == 'transacoes':
+        try:
+            parametros = parametros_relatorio(request.form)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Formato de data inválido.'}), 400
+        # A última transação entra na chave: se houve venda nova, o PDF em disco não serve mais
+        ultima_transacao = db.session.query(db.func.max(Transacao.id)).scalar()
+        url_banco = engine_leitura().url.render_as_string(hide_password=False)
+        chave = submeter('transacoes', url_banco, app.config['SQLITE_PRAGMAS'], parametros,
+                         parametros_chave=dict(parametros, ultima_transacao=ultima_transacao))
+    elif tipo == 'fechamento':
+        dados = dados_fechamento(request.form)
+        chave = submeter('fechamento', dados, parametros_chave=dados)
+    else:
+        return jsonify({'status': 'error', 'message': 'Tipo de relatório inválido.'}), 400
+
+    resposta = situacao(chave)
+    resposta['url_status'] = url_for('situacao_relatorio', chave=chave)
+    resposta['url_download'] = url_for('baixar_relatorio', chave=chave)
+    return jsonify(resposta), 202
+
+@app.route('/relatorios/<chave>')
+@login_required
+def situacao_relatorio(chave):
+    resposta = situacao(chave)
+    if resposta is None:
+        return jsonify({'status': 'error', 'message': 'Relatório não encontrado.'}), 404
+    return jsonify(resposta)
+
+@app.route('/relatorios/<chave>/download')
+@login_required
+def baixar_relatorio(chave):
+    resposta = situacao(chave)
+    if resposta is None:
+        return jsonify({'status': 'error', 'message': 'Relatório não encontrado.'}), 404
+    if resposta['status'] != 'concluido':
+        return jsonify(resposta), 409
+    return send_file(caminho_arquivo(chave), as_attachment=True,
+                     download_name='relatorio.pdf', mimetype='application/pdf', max_age=0)
+
+@app.cli.command('reconstruir-resumos')
+def reconstruir_resumos_vendas():
+    """Recalcula os resumos de vendas a partir de todo o histórico."""
+    reconstruir_resumos()
+    invalidar_totais()
+    print("Resumos de vendas reconstruídos.")
+
+@app.cli.command('verificar-indices')
+def verificar_indices():
+    """Confere com EXPLAIN QUERY PLAN se as consultas das rotas usam os índices."""
+    falhas = 0
+    for rota, descricao, indice, ok, plano in verificar_planos():
+        print(f"[{'OK' if ok else 'FALHA'}] {rota}: {descricao} ({indice})")
+        if not ok:
+            falhas += 1
+            print('    ' + plano.replace('\n', '\n    '))
+    if falhas:
+        raise SystemExit(1)
+
+@app.cli.command('consolidar-estoque')
+def consolidar_estoque():
+    """Soma os movimentos pendentes do livro de estoque ao saldo dos produtos."""
+    print(f"Movimentos consolidados: {consolidar_movimentos()}")
+
+@app.cli.command('limpar-idempotencia')
+def limpar_idempotencia():
+    """Apaga as chaves de idempotência mais antigas que a validade."""
+    print(f"Chaves apagadas: {limpar_chaves_expiradas(app.config.get('IDEMPOTENCIA_VALIDADE_HORAS', 72))}")
+
+@app.cli.command('importar-produtos')
+@click.argument('arquivo', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--criar-categorias', is_flag=True, help='Cria as categorias que não existem em vez de recusar a linha.')
+def importar_catalogo(arquivo, criar_categorias):
+    """Importa produtos de um CSV, atualizando os que já existem pelo código de barras."""
+    try:
+        resumo = importar_produtos(arquivo, criar_categorias=criar_categorias)
+    except ImportacaoInvalida as e:
+        raise click.ClickException(str(e))
+    print(f"Linhas: {resumo['linhas']} | inseridos: {resumo['inseridos']} | atualizados: {resumo['atualizados']} | "
+          f"inalterados: {resumo['inalterados']} | movimentos de estoque: {resumo['movimentos_estoque']}")
+    if resumo['categorias_criadas']:
+        print(f"Categorias criadas: {', '.join(resumo['categorias_criadas'])}")
+    for erro in resumo['erros']:
+        print(f"  linha {erro['linha']} ({erro['codigo_barras'] or '-'}): {erro['mensagem']}")
+    if resumo['total_erros']:
+        print(f"Linhas com erro: {resumo['total_erros']}")
+        raise SystemExit(1)
+
+@app.cli.command('converter-centavos')
+def converter_centavos():
+    """Converte as colunas de dinheiro de bancos antigos (FLOAT) para centavos inteiros."""
+    convertidas = migrar_para_centavos()
+    invalidar_totais()
+    invalidar_catalogo()
+    if convertidas:
+        print(f"Tabelas convertidas para centavos: {', '.join(convertidas)}")
+    else:
+        print("Nenhuma coluna de dinheiro em FLOAT; nada a converter.")
+
 from app import app  
 
 if __name__ == "__main__":
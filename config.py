@@ -1,5 +1,45 @@
+import os
+
+
 class Config:
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///smartcaixa.db'
-    SECRET_KEY = 'Ayce'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('SMARTCAIXA_DATABASE_URI', 'sqlite:///smartcaixa.db')
+    SECRET_KEY = os.environ.get('SMARTCAIXA_SECRET_KEY', 'Ayce')
     UPLOAD_FOLDER = 'static/imagens'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # PRAGMAs aplicados em toda conexão nova com o SQLite. Com WAL a leitura
+    # não bloqueia a escrita: relatórios longos e o checkout rodam juntos.
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',     # com WAL, só fsync no checkpoint
+        'cache_size': -20000,        # negativo = KiB (~20 MB por conexão)
+        'mmap_size': 268435456,      # 256 MB
+        'busy_timeout': 5000,        # ms esperando um lock antes de falhar
+        'temp_store': 'MEMORY',
+    }
+    # Relatórios, listagens e exportações usam um pool separado, somente leitura
+    SQLITE_LEITURA_SEPARADA = True
+
+    # Intervalo da consolidação do livro de estoque em segundos (0 desliga a thread)
+    ESTOQUE_CONSOLIDACAO_SEGUNDOS = 60
+
+    # Chaves de idempotência das vendas: por quanto tempo um reenvio devolve a
+    # venda já gravada (cobre um terminal offline no fim de semana) e de
+    # quanto em quanto tempo as vencidas são apagadas (0 desliga a thread)
+    IDEMPOTENCIA_VALIDADE_HORAS = 72
+    IDEMPOTENCIA_LIMPEZA_SEGUNDOS = 3600
+
+    # Auditoria: registros esperam na fila em memória e são gravados em lote
+    # (até AUDITORIA_LOTE por INSERT, no máximo a cada AUDITORIA_INTERVALO_SEGUNDOS)
+    AUDITORIA_FILA_TAMANHO = 10000
+    AUDITORIA_LOTE = 500
+    AUDITORIA_INTERVALO_SEGUNDOS = 1.0
+
+    # PDFs dos relatórios em segundo plano: apagados depois da validade ou, acima
+    # de RELATORIOS_MAX_ARQUIVOS, dos mais antigos para os mais novos
+    RELATORIOS_VALIDADE_HORAS = 24
+    RELATORIOS_MAX_ARQUIVOS = 50
+
+    CACHE_PRODUTOS_TAMANHO = 50000
+    CACHE_USUARIOS_TTL = 300
+    IMPRESSORA = os.environ.get('SMARTCAIXA_IMPRESSORA')  # ex.: 'arquivo:/dev/usb/lp0' ou 'rede:192.168.0.50:9100'
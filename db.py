@@ -1,5 +1,17 @@
 from app import app
 from models import db
+from utils.busca_produtos import criar_indice_busca
+from utils.esquema import adicionar_colunas_novas
+from utils.indices import criar_indices
+from utils.migracao_centavos import migrar_para_centavos
+from utils.resumos import garantir_resumos
+from utils.turno import vincular_vendas_aos_turnos
 
 with app.app_context():
     db.create_all()
+    if 'transacao.turno_id' in adicionar_colunas_novas():
+        vincular_vendas_aos_turnos()
+    migrar_para_centavos()
+    criar_indices()
+    garantir_resumos()
+    criar_indice_busca()
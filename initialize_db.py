@@ -1,5 +1,11 @@
 from app import app
 from models import db, Usuario
+from utils.busca_produtos import criar_indice_busca
+from utils.esquema import adicionar_colunas_novas
+from utils.indices import criar_indices
+from utils.migracao_centavos import migrar_para_centavos
+from utils.resumos import garantir_resumos
+from utils.turno import vincular_vendas_aos_turnos
 from werkzeug.security import generate_password_hash
 
 # Dados do usuário administrador
@@ -10,6 +16,12 @@ admin_senha = "admin"  # Mude para uma senha mais segura em produção
 with app.app_context():
     # Cria o banco de dados
     db.create_all()
+    if 'transacao.turno_id' in adicionar_colunas_novas():
+        vincular_vendas_aos_turnos()
+    migrar_para_centavos()
+    criar_indices()
+    garantir_resumos()
+    criar_indice_busca()
 
     # Verifica se o usuário administrador já existe
     if not Usuario.query.filter_by(usuario=admin_usuario).first():
@@ -2,6 +2,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
+from utils.dinheiro import Centavos
+
 db = SQLAlchemy()
 
 class Usuario(db.Model, UserMixin):
@@ -25,23 +27,41 @@ class Produto(db.Model):
     nome = db.Column(db.String(100), nullable=False)
     descricao = db.Column(db.String(200))
     codigo_barras = db.Column(db.String(100), unique=True, nullable=False)
-    preco = db.Column(db.Float, nullable=False)
+    preco = db.Column(Centavos, nullable=False)
     estoque = db.Column(db.Integer, nullable=False)
     imagem = db.Column(db.String(100))
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'), nullable=False, index=True)
+    # Controle de concorrência otimista: todo UPDATE do ORM leva "WHERE versao = :lida"
+    # e incrementa a versão; se outro terminal alterou antes, levanta StaleDataError
+    versao = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': versao}
 
     def atualizar_estoque(self, quantidade_vendida):
-        if quantidade_vendida > self.estoque:
+        # A venda entra no livro de movimentos; a linha do produto não é alterada
+        if quantidade_vendida > self.estoque_disponivel:
             raise ValueError("Quantidade vendida excede o estoque disponível.")
-        self.estoque -= quantidade_vendida
+        db.session.add(MovimentoEstoque(produto_id=self.id, quantidade=-quantidade_vendida, tipo='venda'))
         db.session.commit()
 
 class Transacao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     data = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    valor = db.Column(db.Float, nullable=False)
+    valor = db.Column(Centavos, nullable=False)
     metodo_pagamento = db.Column(db.String(20), nullable=False)
+    # Turno em que a venda foi somada; vendas offline podem ter data anterior à abertura
+    turno_id = db.Column(db.Integer, db.ForeignKey('turno.id'))
     itens = db.relationship('ItemTransacao', backref='transacao', lazy=True)
+    turno = db.relationship('Turno')
+
+    __table_args__ = (
+        # Listagens por período e paginação por cursor em (data, id)
+        db.Index('ix_transacao_data_id', 'data', 'id'),
+        # Relatórios e exportação filtrados por forma de pagamento e período
+        db.Index('ix_transacao_metodo_pagamento_data', 'metodo_pagamento', 'data'),
+        # Conferência do turno: GROUP BY só no índice
+        db.Index('ix_transacao_turno_id_metodo_pagamento', 'turno_id', 'metodo_pagamento', 'valor'),
+    )
 
     def adicionar_itens(self, itens):
         for item in itens:
@@ -56,10 +76,10 @@ class Transacao(db.Model):
 
 class ItemTransacao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
     quantidade = db.Column(db.Integer, nullable=False)
-    preco = db.Column(db.Float, nullable=False)
-    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'), nullable=False)
+    preco = db.Column(Centavos, nullable=False)
+    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'), nullable=False, index=True)
 
     produto = db.relationship('Produto', backref='itens_transacao')
 
@@ -67,11 +87,11 @@ class FechamentoCaixa(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     abertura = db.Column(db.DateTime, nullable=False)
     fechamento = db.Column(db.DateTime)
-    total_pix = db.Column(db.Float, default=0.0)
-    total_debito = db.Column(db.Float, default=0.0)
-    total_credito = db.Column(db.Float, default=0.0)
-    total_dinheiro = db.Column(db.Float, default=0.0)
-    fundo_caixa = db.Column(db.Float, default=0.0)
+    total_pix = db.Column(Centavos, default=0)
+    total_debito = db.Column(Centavos, default=0)
+    total_credito = db.Column(Centavos, default=0)
+    total_dinheiro = db.Column(Centavos, default=0)
+    fundo_caixa = db.Column(Centavos, default=0)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
     usuario = db.relationship('Usuario', backref=db.backref('fechamentos', lazy=True))
 
@@ -88,6 +108,86 @@ class Empresa(db.Model):
 
 class Atividade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    data = db.Column(db.DateTime, default=datetime.utcnow)
+    data = db.Column(db.DateTime, default=datetime.now)
     usuario = db.Column(db.String(150))
     acao = db.Column(db.String(255))
+
+    __table_args__ = (
+        # Página de auditoria: por período e por usuário, com cursor em (data, id)
+        db.Index('ix_atividade_data_id', 'data', 'id'),
+        db.Index('ix_atividade_usuario_data_id', 'usuario', 'data', 'id'),
+    )
+
+# Livro de movimentos de estoque: vendas, ajustes e entradas só geram INSERTs.
+# Produto.estoque guarda o saldo consolidado; os movimentos ainda não
+# consolidados somam-se a ele até a próxima consolidação.
+class MovimentoEstoque(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False)  # negativa nas saídas
+    tipo = db.Column(db.String(20), nullable=False)  # venda, ajuste ou entrada
+    data = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'))
+    consolidado = db.Column(db.Boolean, nullable=False, default=False)
+
+    __table_args__ = (
+        # Histórico de um produto, do mais recente para o mais antigo
+        db.Index('ix_movimento_estoque_produto_id_id', 'produto_id', 'id'),
+        # Índice parcial só com os pendentes: a soma do saldo não lê o histórico.
+        # Com consolidado na chave o planejador o prefere ao índice acima (e
+        # o usa como covering) qualquer que seja a ordem de criação
+        db.Index('ix_movimento_estoque_pendente', 'produto_id', 'consolidado', 'quantidade',
+                 sqlite_where=db.text('consolidado = 0')),
+    )
+
+# Estoque disponível agora: saldo consolidado + movimentos pendentes
+Produto.estoque_disponivel = db.column_property(
+    Produto.estoque + db.func.coalesce(
+        db.select(db.func.sum(MovimentoEstoque.quantidade))
+        .where(MovimentoEstoque.produto_id == Produto.id, MovimentoEstoque.consolidado == False)
+        .correlate_except(MovimentoEstoque)
+        .scalar_subquery(),
+        0
+    ),
+    deferred=True
+)
+
+# Chaves de idempotência geradas pelo terminal: a mesma venda reenviada
+# devolve a resposta gravada na primeira vez, sem registrar de novo
+class ChaveIdempotencia(db.Model):
+    chave = db.Column(db.String(64), primary_key=True)
+    criada_em = db.Column(db.DateTime, default=datetime.now, nullable=False, index=True)
+    status_code = db.Column(db.Integer, nullable=False)
+    resposta = db.Column(db.Text, nullable=False)  # JSON
+
+# Resumos de vendas pré-agregados, atualizados na mesma transação de cada venda
+class ResumoVendaHora(db.Model):
+    hora = db.Column(db.DateTime, primary_key=True)
+    metodo_pagamento = db.Column(db.String(20), primary_key=True)
+    quantidade_vendas = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_itens = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(Centavos, nullable=False, default=0)
+
+class ResumoVendaProdutoDia(db.Model):
+    dia = db.Column(db.Date, primary_key=True)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(Centavos, nullable=False, default=0)
+
+class ResumoVendaCategoriaDia(db.Model):
+    dia = db.Column(db.Date, primary_key=True)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'), primary_key=True)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(Centavos, nullable=False, default=0)
+
+# Turno de caixa aberto, com totais acumulados a cada venda
+class Turno(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    abertura = db.Column(db.DateTime, nullable=False)
+    fechamento = db.Column(db.DateTime, index=True)
+    total_pix = db.Column(Centavos, nullable=False, default=0)
+    total_debito = db.Column(Centavos, nullable=False, default=0)
+    total_credito = db.Column(Centavos, nullable=False, default=0)
+    total_dinheiro = db.Column(Centavos, nullable=False, default=0)
+    quantidade_vendas = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_itens = db.Column(db.Integer, nullable=False, default=0)
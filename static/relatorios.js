@@ -0,0 +1,36 @@
+// Envia o formulário de relatório para a fila em segundo plano e baixa o PDF quando ficar pronto
+function gerarRelatorioEmSegundoPlano(form, tipo) {
+    form.addEventListener('submit', async (event) => {
+        event.preventDefault();
+        const botao = form.querySelector('button[type="submit"]');
+        const textoOriginal = botao.textContent;
+        botao.disabled = true;
+
+        try {
+            const dados = new FormData(form);
+            dados.append('tipo', tipo);
+            let resposta = await fetch('/relatorios', { method: 'POST', body: dados });
+            let tarefa = await resposta.json();
+            if (!resposta.ok) {
+                throw new Error(tarefa.message);
+            }
+
+            while (tarefa.status === 'pendente' || tarefa.status === 'executando') {
+                botao.textContent = `Gerando... ${Math.round((tarefa.bytes || 0) / 1024)} KB`;
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                resposta = await fetch(tarefa.url_status || `/relatorios/${tarefa.id}`);
+                tarefa = Object.assign(tarefa, await resposta.json());
+            }
+
+            if (tarefa.status !== 'concluido') {
+                throw new Error(tarefa.erro || 'Falha ao gerar o relatório');
+            }
+            window.location.href = tarefa.url_download;
+        } catch (erro) {
+            alert('Erro: ' + erro.message);
+        } finally {
+            botao.disabled = false;
+            botao.textContent = textoOriginal;
+        }
+    });
+}
@@ -0,0 +1,42 @@
+"""Índices das consultas frequentes
+
+Revision ID: 4b7e2d9a1c3f
+Revises: c60eb13ae74c
+Create Date: 2026-10-18 09:12:31.482115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2d9a1c3f'
+down_revision = 'c60eb13ae74c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transacao', schema=None) as batch_op:
+        batch_op.create_index('ix_transacao_data_id', ['data', 'id'], unique=False)
+        batch_op.create_index('ix_transacao_metodo_pagamento_data', ['metodo_pagamento', 'data'], unique=False)
+
+    with op.batch_alter_table('item_transacao', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_item_transacao_transacao_id'), ['transacao_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_item_transacao_produto_id'), ['produto_id'], unique=False)
+
+    with op.batch_alter_table('produto', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_produto_categoria_id'), ['categoria_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('produto', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_produto_categoria_id'))
+
+    with op.batch_alter_table('item_transacao', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_item_transacao_produto_id'))
+        batch_op.drop_index(batch_op.f('ix_item_transacao_transacao_id'))
+
+    with op.batch_alter_table('transacao', schema=None) as batch_op:
+        batch_op.drop_index('ix_transacao_metodo_pagamento_data')
+        batch_op.drop_index('ix_transacao_data_id')
@@ -29,7 +29,7 @@ class Produto(db.Model):
     preco = db.Column(db.Float, nullable=False)
     estoque = db.Column(db.Integer, nullable=False)
     imagem = db.Column(db.String(100))
-    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'), nullable=False)
+    categoria_id = db.Column(db.Integer, db.ForeignKey('categoria.id'), nullable=False, index=True)
 
 
     def atualizar_estoque(self, quantidade_vendida):
@@ -45,6 +45,13 @@ class Transacao(db.Model):
     metodo_pagamento = db.Column(db.String(20), nullable=False)
     itens = db.relationship('ItemTransacao', backref='transacao', lazy=True)
 
+    __table_args__ = (
+        # Listagens por período e paginação por cursor em (data, id)
+        db.Index('ix_transacao_data_id', 'data', 'id'),
+        # Totais por forma de pagamento no fechamento de caixa
+        db.Index('ix_transacao_metodo_pagamento_data', 'metodo_pagamento', 'data'),
+    )
+
     def adicionar_itens(self, itens):
         for item in itens:
             item_transacao = ItemTransacao(
@@ -58,10 +65,10 @@ class Transacao(db.Model):
 
 class ItemTransacao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False)
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id'), nullable=False, index=True)
     quantidade = db.Column(db.Integer, nullable=False)
     preco = db.Column(db.Float, nullable=False)
-    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'), nullable=False)
+    transacao_id = db.Column(db.Integer, db.ForeignKey('transacao.id'), nullable=False, index=True)
     
     produto = db.relationship('Produto', backref='itens_transacao')
 
@@ -0,0 +1,190 @@
+from datetime import datetime
+
+from sqlalchemy import Integer, func, insert, literal, select, type_coerce, update
+
+from models import db, Atividade, MovimentoEstoque, Produto
+from utils.banco import iniciar_transacao_escrita
+from utils.catalogo import invalidar_catalogo
+from utils.dinheiro import Centavos, para_centavos, para_decimal
+
+TAMANHO_AMOSTRA = 20
+
+TIPOS_PRECO = ('percentual', 'absoluto')
+TIPOS_ESTOQUE = ('somar', 'definir')
+
+_tabela = Produto.__table__
+# Preço em centavos como inteiro puro: as contas abaixo não passam pelo Centavos
+_centavos = type_coerce(_tabela.c.preco, Integer)
+
+
+class AlteracaoInvalida(ValueError):
+    pass
+
+
+def _lista_codigos(codigos):
+    # Texto do formulário (um por linha ou separados por vírgula) ou lista do
+    # JSON, onde o código pode chegar como número
+    if codigos is None:
+        return []
+    if isinstance(codigos, str):
+        codigos = codigos.replace(',', '\n').splitlines()
+    elif not isinstance(codigos, list):
+        codigos = [codigos]
+    codigos = (str(codigo).strip() for codigo in codigos if codigo is not None)
+    return [codigo for codigo in codigos if codigo]
+
+
+def _nome(filtro):
+    nome = filtro.get('nome')
+    return str(nome).strip() if nome is not None else ''
+
+
+def condicoes_filtro(filtro):
+    """Condições do WHERE para ``{'categoria_id', 'codigos_barras', 'nome'}``.
+
+    Os critérios se somam (AND). Pelo menos um é obrigatório; para alterar o
+    catálogo inteiro é preciso pedir ``{'todos': True}``.
+    """
+    filtro = filtro or {}
+    if not isinstance(filtro, dict):
+        raise AlteracaoInvalida('Filtro inválido!')
+    condicoes = []
+    if filtro.get('categoria_id') not in (None, ''):
+        try:
+            condicoes.append(_tabela.c.categoria_id == int(filtro['categoria_id']))
+        except (TypeError, ValueError):
+            raise AlteracaoInvalida('Categoria inválida!')
+    codigos = _lista_codigos(filtro.get('codigos_barras'))
+    if codigos:
+        condicoes.append(_tabela.c.codigo_barras.in_(codigos))
+    if _nome(filtro):
+        condicoes.append(_tabela.c.nome.ilike(f"%{_nome(filtro)}%"))
+    if not condicoes and not filtro.get('todos'):
+        raise AlteracaoInvalida('Informe uma categoria, códigos de barras ou um filtro por nome!')
+    return condicoes
+
+
+def _novo_preco(tipo, valor):
+    # Expressão SQL do novo preço em centavos, nunca abaixo de zero
+    try:
+        valor = para_decimal(valor)
+    except (ArithmeticError, TypeError):
+        raise AlteracaoInvalida('Valor do reajuste inválido!')
+    if valor is None or not valor.is_finite():
+        raise AlteracaoInvalida('Valor do reajuste inválido!')
+    if tipo == 'percentual':
+        # Centésimos de ponto percentual em inteiro: arredondamento exato, meio para cima
+        fator = 10000 + int(valor * 100)
+        if fator < 0:
+            raise AlteracaoInvalida('O reajuste não pode passar de -100%!')
+        return (_centavos * fator + 5000) // 10000, f'{valor:+}%'
+    if tipo == 'absoluto':
+        return func.max(_centavos + para_centavos(valor), 0), f'R$ {valor:+}'
+    raise AlteracaoInvalida(f"Tipo de reajuste inválido! Use {' ou '.join(TIPOS_PRECO)}.")
+
+
+def _auditar(usuario, acao):
+    db.session.add(Atividade(usuario=usuario, acao=acao[:255]))
+
+
+def _descrever_filtro(filtro):
+    partes = []
+    if filtro.get('categoria_id') not in (None, ''):
+        partes.append(f"categoria {filtro['categoria_id']}")
+    codigos = _lista_codigos(filtro.get('codigos_barras'))
+    if codigos:
+        partes.append(f'{len(codigos)} código(s) de barras')
+    if _nome(filtro):
+        partes.append(f"nome contendo '{_nome(filtro)}'")
+    return ', '.join(partes) or 'todo o catálogo'
+
+
+def reajustar_precos(filtro, tipo, valor, usuario=None, simular=False):
+    """Reajusta os preços dos produtos do filtro com um único UPDATE.
+
+    ``tipo`` é 'percentual' (``valor`` em %) ou 'absoluto' (``valor`` em R$
+    somado ao preço). Só entram os produtos cujo preço muda; eles ganham uma
+    nova versão, o que faz formulários de edição abertos darem conflito. Com
+    ``simular`` nada é gravado: devolve só a contagem e uma amostra.
+    """
+    condicoes = condicoes_filtro(filtro)
+    novo, descricao = _novo_preco(tipo, valor)
+    alvo = condicoes + [_centavos != novo]
+    try:
+        if not simular:
+            iniciar_transacao_escrita()
+        produtos = db.session.execute(select(func.count()).select_from(_tabela).where(*alvo)).scalar()
+        amostra = [
+            {'id': produto_id, 'codigo_barras': codigo, 'nome': nome, 'preco': preco, 'novo_preco': novo_preco}
+            for produto_id, codigo, nome, preco, novo_preco in db.session.execute(
+                select(_tabela.c.id, _tabela.c.codigo_barras, _tabela.c.nome, _tabela.c.preco,
+                       type_coerce(novo, Centavos)).where(*alvo).order_by(_tabela.c.id).limit(TAMANHO_AMOSTRA)
+            )
+        ]
+        if not simular and produtos:
+            db.session.execute(update(_tabela).where(*alvo).values(preco=novo, versao=_tabela.c.versao + 1))
+            _auditar(usuario, f'Reajuste de preço {descricao} em {produtos} produto(s): {_descrever_filtro(filtro)}')
+            db.session.commit()
+            invalidar_catalogo()
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'produtos': produtos, 'amostra': amostra, 'simulado': bool(simular)}
+
+
+def ajustar_estoque_em_massa(filtro, tipo, quantidade, usuario=None, simular=False):
+    """Ajusta o estoque dos produtos do filtro com um único INSERT ... SELECT
+    no livro de estoque (um movimento 'ajuste' por produto).
+
+    ``tipo`` é 'somar' (``quantidade`` entra ou sai do saldo disponível) ou
+    'definir' (o saldo disponível passa a ser ``quantidade``). Produtos que
+    ficariam com saldo negativo não são ajustados e são contados em
+    ``ignorados``.
+    """
+    condicoes = condicoes_filtro(filtro)
+    try:
+        quantidade = int(quantidade)
+    except (TypeError, ValueError):
+        raise AlteracaoInvalida('Quantidade inválida!')
+    disponivel = Produto.estoque_disponivel.expression
+    if tipo == 'somar':
+        movimento, saldo = literal(quantidade), disponivel + quantidade
+        descricao = f'{quantidade:+} unidade(s)'
+    elif tipo == 'definir':
+        movimento, saldo = quantidade - disponivel, literal(quantidade)
+        descricao = f'saldo definido em {quantidade}'
+    else:
+        raise AlteracaoInvalida(f"Tipo de ajuste inválido! Use {' ou '.join(TIPOS_ESTOQUE)}.")
+    alvo = condicoes + [movimento != 0, saldo >= 0]
+    try:
+        if not simular:
+            # Mesma transação de escrita do INSERT: nenhuma venda muda o saldo no meio
+            iniciar_transacao_escrita()
+        selecionados = db.session.execute(
+            select(func.count()).select_from(_tabela).where(*condicoes, movimento != 0)
+        ).scalar()
+        produtos = db.session.execute(select(func.count()).select_from(_tabela).where(*alvo)).scalar()
+        amostra = [
+            {'id': produto_id, 'codigo_barras': codigo, 'nome': nome, 'estoque': estoque, 'novo_estoque': novo_estoque}
+            for produto_id, codigo, nome, estoque, novo_estoque in db.session.execute(
+                select(_tabela.c.id, _tabela.c.codigo_barras, _tabela.c.nome, disponivel, saldo)
+                .where(*alvo).order_by(_tabela.c.id).limit(TAMANHO_AMOSTRA)
+            )
+        ]
+        if not simular and produtos:
+            db.session.execute(insert(MovimentoEstoque.__table__).from_select(
+                ['produto_id', 'quantidade', 'tipo', 'data', 'consolidado'],
+                select(_tabela.c.id, movimento, literal('ajuste'), literal(datetime.now(), db.DateTime), literal(False))
+                .where(*alvo)
+            ))
+            _auditar(usuario, f'Ajuste de estoque ({descricao}) em {produtos} produto(s): {_descrever_filtro(filtro)}')
+            db.session.commit()
+            invalidar_catalogo()
+        else:
+            db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'produtos': produtos, 'ignorados': selecionados - produtos, 'amostra': amostra, 'simulado': bool(simular)}
@@ -0,0 +1,136 @@
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import has_request_context
+from flask_login import current_user
+from sqlalchemy import insert
+
+from models import db, Atividade
+from utils.banco import sessao_leitura
+from utils.paginacao import pagina_por_cursor
+from utils.segundo_plano import FilaSegundoPlano
+
+LIMITE_PAGINA = 200
+
+
+class RegistroAuditoria(FilaSegundoPlano):
+    """Fila limitada de registros de auditoria, gravada em lotes por uma thread.
+
+    ``registrar`` só põe uma tupla na fila, sem tocar no banco: a requisição
+    não ganha nenhum commit. A thread junta até ``lote`` registros (ou o que
+    chegar em ``intervalo`` segundos) e grava com um único INSERT. Com a
+    fila cheia o registro é descartado e contado, nunca bloqueia a requisição.
+    """
+
+    nome = 'auditoria'
+
+    def __init__(self, tamanho_max=10000, lote=500, intervalo=1.0):
+        super().__init__(tamanho_max)
+        self.lote = lote
+        self.intervalo = intervalo
+        self.gravados = 0
+        self.descartados = 0
+        self.erros = 0
+        self._gravacao = threading.Lock()
+
+    def configurar(self, app):
+        super().configurar(app)
+        self.lote = app.config.get('AUDITORIA_LOTE', self.lote)
+        self.intervalo = app.config.get('AUDITORIA_INTERVALO_SEGUNDOS', self.intervalo)
+        tamanho_max = app.config.get('AUDITORIA_FILA_TAMANHO', self._fila.maxsize)
+        if tamanho_max != self._fila.maxsize and self._fila.empty():
+            self._fila = queue.Queue(maxsize=tamanho_max)
+        # O que ainda está na fila é gravado quando o processo termina
+        atexit.register(self.descarregar)
+
+    def registrar(self, acao, usuario=None):
+        if usuario is None and has_request_context() and current_user.is_authenticated:
+            usuario = current_user.usuario
+        try:
+            self._fila.put_nowait((datetime.now(), usuario, acao[:255]))
+        except queue.Full:
+            self.descartados += 1
+            return
+        self.iniciar()
+
+    def _retirar_lote(self, primeiro):
+        lote = [primeiro]
+        prazo = time.monotonic() + self.intervalo
+        while len(lote) < self.lote:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _gravar(self, lote):
+        with self._gravacao:
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conexao:
+                        conexao.execute(insert(Atividade.__table__), [
+                            {'data': data, 'usuario': usuario, 'acao': acao} for data, usuario, acao in lote
+                        ])
+                self.gravados += len(lote)
+            except Exception as e:
+                self.erros += len(lote)
+                print(f"Erro ao gravar a auditoria: {e}")
+
+    def _trabalhar(self):
+        # Em lotes: um INSERT para vários registros, não um por item como na FilaSegundoPlano
+        while True:
+            lote = self._retirar_lote(self._fila.get())
+            self._gravar(lote)
+
+    def descarregar(self):
+        """Grava agora, nesta thread, tudo o que está na fila."""
+        lote = []
+        while True:
+            try:
+                lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                break
+            if len(lote) == self.lote:
+                self._gravar(lote)
+                lote = []
+        if lote:
+            self._gravar(lote)
+
+    def estatisticas(self):
+        return {
+            'na_fila': self._fila.qsize(),
+            'tamanho_max': self._fila.maxsize,
+            'gravados': self.gravados,
+            'descartados': self.descartados,
+            'erros': self.erros,
+        }
+
+
+registro_auditoria = RegistroAuditoria()
+
+
+def filtros_auditoria(usuario=None, texto=None, inicio=None, fim=None):
+    filtros = []
+    if usuario:
+        filtros.append(Atividade.usuario == usuario)
+    if texto:
+        filtros.append(Atividade.acao.contains(texto, autoescape=True))
+    if inicio is not None:
+        filtros.append(Atividade.data >= inicio)
+    if fim is not None:
+        filtros.append(Atividade.data < fim + timedelta(days=1))
+    return filtros
+
+
+def pagina_atividades(filtros, apos=None, antes=None, limite=LIMITE_PAGINA):
+    """Página da auditoria por cursor sobre (data, id), mais recentes primeiro.
+    Veja ``paginacao.pagina_por_cursor``.
+    """
+    query = sessao_leitura().query(Atividade).filter(*filtros)
+    return pagina_por_cursor(query, Atividade.data, Atividade.id, apos, antes, limite)
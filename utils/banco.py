@@ -0,0 +1,87 @@
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from models import db
+
+# Bind do pool somente leitura: relatórios, listagens e exportações leem por
+# ele e nunca seguram o lock de escrita que o checkout precisa
+BIND_LEITURA = 'leitura'
+
+
+def url_leitura(url):
+    """URL do mesmo arquivo SQLite aberto com ``mode=ro``, ou None se não se aplica."""
+    url = make_url(url)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return None
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database).update_query_dict({'mode': 'ro', 'uri': 'true'})
+
+
+def registrar_pragmas(engine, pragmas, somente_leitura=False):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def aplicar_pragmas(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            for nome, valor in pragmas.items():
+                # O modo do journal é do arquivo: só a conexão de escrita o altera
+                if somente_leitura and nome == 'journal_mode':
+                    continue
+                cursor.execute(f'PRAGMA {nome} = {valor}')
+            if somente_leitura:
+                cursor.execute('PRAGMA query_only = ON')
+        finally:
+            cursor.close()
+
+
+def configurar_banco(app):
+    """Inicializa o db com os PRAGMAs da configuração e o pool somente leitura."""
+    if app.config.get('SQLITE_LEITURA_SEPARADA', True):
+        leitura = url_leitura(app.config['SQLALCHEMY_DATABASE_URI'])
+        if leitura is not None:
+            binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+            binds.setdefault(BIND_LEITURA, leitura.render_as_string(hide_password=False))
+
+    db.init_app(app)
+
+    pragmas = app.config.get('SQLITE_PRAGMAS', {})
+    with app.app_context():
+        registrar_pragmas(db.engine, pragmas)
+        if BIND_LEITURA in db.engines:
+            registrar_pragmas(db.engines[BIND_LEITURA], pragmas, somente_leitura=True)
+
+    app.teardown_appcontext(fechar_sessao_leitura)
+
+
+def engine_leitura():
+    return db.engines.get(BIND_LEITURA, db.engine)
+
+
+def sessao_leitura():
+    """Sessão ORM do pool somente leitura, uma por requisição."""
+    if 'sessao_leitura' not in g:
+        g.sessao_leitura = Session(engine_leitura())
+    return g.sessao_leitura
+
+
+def fechar_sessao_leitura(excecao=None):
+    sessao = g.pop('sessao_leitura', None)
+    if sessao is not None:
+        sessao.close()
+
+
+def iniciar_transacao_escrita():
+    """Abre na sessão uma transação de escrita explícita (BEGIN IMMEDIATE).
+
+    O pysqlite só emite BEGIN antes do primeiro INSERT/UPDATE/DELETE: um
+    SAVEPOINT aberto antes disso vira a própria transação e o seu RELEASE
+    já grava tudo. Com o BEGIN explícito os SAVEPOINTs ficam aninhados de
+    verdade, e o lock de escrita é pego no início, esperando o busy_timeout.
+    """
+    conexao = db.session.connection()
+    if conexao.dialect.name == 'sqlite' and not conexao.connection.dbapi_connection.in_transaction:
+        conexao.exec_driver_sql('BEGIN IMMEDIATE')
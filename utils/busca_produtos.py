@@ -0,0 +1,100 @@
+import re
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Produto
+from utils.dinheiro import Centavos
+
+LIMITE_BUSCA = 50
+
+# Índice de texto completo (FTS5) sobre o catálogo. É uma tabela de conteúdo
+# externo: o texto fica só em "produto" e os gatilhos mantêm o índice em dia.
+# remove_diacritics faz "acucar" encontrar "Açúcar"; prefix acelera buscas por
+# prefixo de 2 e 3 caracteres enquanto o usuário digita.
+SQL_INDICE = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS produto_fts USING fts5(
+        nome, descricao, codigo_barras,
+        content='produto', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS produto_fts_ai AFTER INSERT ON produto BEGIN
+        INSERT INTO produto_fts(rowid, nome, descricao, codigo_barras)
+        VALUES (new.id, new.nome, new.descricao, new.codigo_barras);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS produto_fts_ad AFTER DELETE ON produto BEGIN
+        INSERT INTO produto_fts(produto_fts, rowid, nome, descricao, codigo_barras)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.codigo_barras);
+    END""",
+    # Só reindexa quando muda texto; a baixa de estoque do checkout não passa por aqui
+    """CREATE TRIGGER IF NOT EXISTS produto_fts_au AFTER UPDATE OF nome, descricao, codigo_barras ON produto BEGIN
+        INSERT INTO produto_fts(produto_fts, rowid, nome, descricao, codigo_barras)
+        VALUES ('delete', old.id, old.nome, old.descricao, old.codigo_barras);
+        INSERT INTO produto_fts(rowid, nome, descricao, codigo_barras)
+        VALUES (new.id, new.nome, new.descricao, new.codigo_barras);
+    END""",
+]
+
+# Pesos do bm25 na ordem das colunas: nome, descricao, codigo_barras
+SQL_BUSCA = text("""
+    SELECT p.id, p.nome, p.descricao, p.codigo_barras, p.preco,
+           p.estoque + COALESCE((SELECT SUM(m.quantidade) FROM movimento_estoque m
+                                 WHERE m.produto_id = p.id AND m.consolidado = 0), 0) AS estoque
+    FROM produto_fts
+    JOIN produto p ON p.id = produto_fts.rowid
+    WHERE produto_fts MATCH :termos
+    ORDER BY bm25(produto_fts, 10.0, 1.0, 5.0)
+    LIMIT :limite
+""").columns(preco=Centavos)
+
+_indice_pronto = False
+_fts_disponivel = True
+
+
+def criar_indice_busca():
+    global _indice_pronto, _fts_disponivel
+    try:
+        existia = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produto_fts'")
+        ).first() is not None
+        for sql in SQL_INDICE:
+            db.session.execute(text(sql))
+        if not existia:
+            db.session.execute(text("INSERT INTO produto_fts(produto_fts) VALUES ('rebuild')"))
+        db.session.commit()
+    except OperationalError as e:
+        # SQLite compilado sem FTS5: a busca cai no LIKE
+        db.session.rollback()
+        print(f"Índice de busca indisponível: {e}")
+        _fts_disponivel = False
+    _indice_pronto = True
+
+
+def montar_termos(consulta):
+    # Cada palavra vira um termo entre aspas com busca por prefixo, o que
+    # também neutraliza a sintaxe do FTS5 (AND, OR, NEAR, aspas, "-" ...)
+    palavras = re.findall(r'\w+', consulta)
+    return ' '.join(f'"{palavra}"*' for palavra in palavras)
+
+
+def buscar_produtos(consulta, limite=LIMITE_BUSCA):
+    if not _indice_pronto:
+        criar_indice_busca()
+
+    limite = max(1, min(limite, LIMITE_BUSCA))
+    termos = montar_termos(consulta)
+    if not termos:
+        return []
+
+    if not _fts_disponivel:
+        produtos = Produto.query.with_entities(
+            Produto.id, Produto.nome, Produto.descricao, Produto.codigo_barras, Produto.preco,
+            Produto.estoque_disponivel.label('estoque')
+        ).filter(
+            Produto.nome.ilike(f'%{consulta}%') | Produto.codigo_barras.ilike(f'%{consulta}%')
+        ).limit(limite)
+        return [dict(p._mapping) for p in produtos]
+
+    linhas = db.session.execute(SQL_BUSCA, {'termos': termos, 'limite': limite})
+    return [dict(linha._mapping) for linha in linhas]
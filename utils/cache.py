@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheLRU:
+    """Cache em memória limitado por tamanho, com descarte do item menos usado (LRU).
+
+    Com ``ttl`` (em segundos) cada item também expira depois desse tempo.
+    Seguro para uso entre threads e com contadores de acertos/faltas.
+    """
+
+    def __init__(self, tamanho_max=1000, ttl=None):
+        self.tamanho_max = tamanho_max
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self.descartes = 0
+
+    def get(self, chave):
+        with self._lock:
+            try:
+                expira_em, valor = self._itens[chave]
+            except KeyError:
+                self.faltas += 1
+                return None
+            if expira_em is not None and expira_em <= time.monotonic():
+                del self._itens[chave]
+                self.faltas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def set(self, chave, valor):
+        expira_em = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._itens[chave] = (expira_em, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def pop(self, chave):
+        with self._lock:
+            item = self._itens.pop(chave, None)
+        return item[1] if item is not None else None
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def redimensionar(self, tamanho_max):
+        with self._lock:
+            self.tamanho_max = tamanho_max
+            while len(self._itens) > self.tamanho_max:
+                self._itens.popitem(last=False)
+                self.descartes += 1
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                'itens': len(self._itens),
+                'tamanho_max': self.tamanho_max,
+                'acertos': self.acertos,
+                'faltas': self.faltas,
+                'descartes': self.descartes,
+                'taxa_acerto': round(self.acertos / consultas, 4) if consultas else 0.0,
+            }
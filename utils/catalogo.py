@@ -0,0 +1,92 @@
+import threading
+
+from utils.cache import CacheLRU
+
+# Cache do catálogo do PDV: cada produto fica guardado pelo id e pelo código de barras
+cache_produtos = CacheLRU(tamanho_max=50000)
+
+# Toda invalidação avança a geração. Quem leu o produto do banco numa geração
+# anterior não guarda: a leitura pode ser de antes de uma venda ou alteração
+# que já limpou o cache, e o preço e o estoque velhos voltariam para ficar
+_geracao = 0
+_lock = threading.Lock()
+
+
+def configurar_cache(app):
+    cache_produtos.redimensionar(app.config.get('CACHE_PRODUTOS_TAMANHO', 50000))
+
+
+def produto_para_dict(produto):
+    return {
+        'id': produto.id,
+        'nome': produto.nome,
+        'descricao': produto.descricao,
+        'codigo_barras': produto.codigo_barras,
+        'preco': produto.preco,
+        'estoque': produto.estoque_disponivel,
+    }
+
+
+def geracao_catalogo():
+    """Geração atual do cache; leia antes de ir ao banco e passe a ``guardar_produto``."""
+    return _geracao
+
+
+def guardar_produto(produto, geracao=None):
+    """Guarda o produto no cache, a menos que houve invalidação desde ``geracao``.
+
+    Sem ``geracao`` guarda sempre (dados que acabaram de ser gravados).
+    Retorna os dados do produto, guardados ou não.
+    """
+    dados = produto_para_dict(produto) if not isinstance(produto, dict) else produto
+    with _lock:
+        if geracao is not None and geracao != _geracao:
+            return dados
+        _descartar(dados['id'])
+        cache_produtos.set(('id', dados['id']), dados)
+        cache_produtos.set(('codigo', dados['codigo_barras']), dados)
+    return dados
+
+
+def buscar_por_codigo(codigo_barras):
+    return cache_produtos.get(('codigo', codigo_barras))
+
+
+def buscar_por_id(produto_id):
+    return cache_produtos.get(('id', produto_id))
+
+
+def _descartar(produto_id, codigo_barras=None):
+    # As duas chaves são descartadas de forma independente pelo LRU, então o
+    # código de barras conhecido pelo chamador também é removido
+    dados = cache_produtos.pop(('id', produto_id))
+    if dados is not None:
+        cache_produtos.pop(('codigo', dados['codigo_barras']))
+    if codigo_barras is not None:
+        cache_produtos.pop(('codigo', codigo_barras))
+
+
+def _avancar_geracao():
+    # Chamada com _lock
+    global _geracao
+    _geracao += 1
+
+
+def invalidar_produto(produto_id, codigo_barras=None):
+    with _lock:
+        _avancar_geracao()
+        _descartar(produto_id, codigo_barras)
+
+
+def invalidar_produtos(produtos):
+    with _lock:
+        _avancar_geracao()
+        for produto in produtos:
+            _descartar(produto.id, produto.codigo_barras)
+
+
+def invalidar_catalogo():
+    # Alterações em massa limpam o cache uma vez, em vez de produto por produto
+    with _lock:
+        _avancar_geracao()
+        cache_produtos.limpar()
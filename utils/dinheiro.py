@@ -0,0 +1,49 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.types import Integer, TypeDecorator
+
+CENTAVO = Decimal('0.01')
+
+
+def para_decimal(valor):
+    """Converte um valor em reais (formulário, JSON ou float) em Decimal com 2 casas."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = valor.strip().replace(',', '.')
+    elif isinstance(valor, float):
+        # repr dá o menor texto que representa o float: 0.1 vira '0.1', não 0.1000000000000000055...
+        valor = repr(valor)
+    return Decimal(valor).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def para_centavos(valor):
+    return int(para_decimal(valor) * 100)
+
+
+class Centavos(TypeDecorator):
+    """Dinheiro: Decimal em reais no Python, inteiro de centavos no banco.
+
+    Com inteiros no banco os SUM do SQLite são exatos e os totais não precisam
+    de arredondamento depois.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else para_centavos(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else Decimal(int(value)).scaleb(-2)
+
+
+class ProvedorJSON(DefaultJSONProvider):
+    """JSON do app com os valores em Decimal como número, como o PDV espera."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return DefaultJSONProvider.default(o)
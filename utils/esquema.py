@@ -0,0 +1,27 @@
+from sqlalchemy.schema import CreateColumn
+
+from models import db
+
+# create_all não altera tabelas que já existem: colunas novas dos modelos são
+# adicionadas aqui com ALTER TABLE ... ADD COLUMN. No SQLite uma coluna NOT
+# NULL só pode ser adicionada com server_default.
+
+
+def colunas_faltando(conexao):
+    faltando = []
+    for tabela in db.metadata.sorted_tables:
+        existentes = {linha[1] for linha in conexao.exec_driver_sql(f'PRAGMA table_info("{tabela.name}")')}
+        if not existentes:
+            continue
+        faltando.extend((tabela, coluna) for coluna in tabela.columns if coluna.name not in existentes)
+    return faltando
+
+
+def adicionar_colunas_novas():
+    """Adiciona às tabelas existentes as colunas declaradas nos modelos. Retorna ``['tabela.coluna']``."""
+    with db.engine.begin() as conexao:
+        faltando = colunas_faltando(conexao)
+        for tabela, coluna in faltando:
+            definicao = CreateColumn(coluna).compile(dialect=conexao.dialect)
+            conexao.exec_driver_sql(f'ALTER TABLE "{tabela.name}" ADD COLUMN {definicao}')
+    return [f'{tabela.name}.{coluna.name}' for tabela, coluna in faltando]
@@ -0,0 +1,97 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só há a variante gzip
+    brotli = None
+
+# Os arquivos de static/ não mudam com o servidor rodando: na inicialização
+# cada um recebe um hash do conteúdo, que vai na URL (?v=...), e as variantes
+# comprimidas ficam prontas em memória. Com o hash na URL o navegador pode
+# guardar o arquivo para sempre; um arquivo alterado ganha outra URL.
+# static/imagens fica de fora: recebe uploads e tem a sua própria rota.
+PASTAS_IGNORADAS = {'imagens'}
+TIPOS_COMPRIMIDOS = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'image/vnd.microsoft.icon', 'image/x-icon')
+TAMANHO_MAXIMO = 2 * 1024 * 1024
+UM_ANO = 31536000
+
+
+class ArquivoEstatico:
+    __slots__ = ('versao', 'mimetype', 'variantes')
+
+    def __init__(self, conteudo, mimetype):
+        self.versao = hashlib.sha256(conteudo).hexdigest()[:12]
+        self.mimetype = mimetype
+        self.variantes = {'identity': conteudo}
+        if mimetype.startswith(TIPOS_COMPRIMIDOS):
+            comprimidos = {'gzip': gzip.compress(conteudo, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                comprimidos['br'] = brotli.compress(conteudo, quality=11)
+            for codificacao, dados in comprimidos.items():
+                if len(dados) < len(conteudo):
+                    self.variantes[codificacao] = dados
+
+    def escolher(self, aceitas):
+        for codificacao in ('br', 'gzip'):
+            if codificacao in self.variantes and codificacao in aceitas:
+                return codificacao
+        return 'identity'
+
+
+def carregar_estaticos(pasta):
+    arquivos = {}
+    for raiz, pastas, nomes in os.walk(pasta):
+        if raiz == pasta:
+            pastas[:] = [p for p in pastas if p not in PASTAS_IGNORADAS]
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            if nome.startswith('.') or os.path.getsize(caminho) > TAMANHO_MAXIMO:
+                continue
+            with open(caminho, 'rb') as arquivo:
+                conteudo = arquivo.read()
+            mimetype = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+            relativo = os.path.relpath(caminho, pasta).replace(os.sep, '/')
+            arquivos[relativo] = ArquivoEstatico(conteudo, mimetype)
+    return arquivos
+
+
+def configurar_estaticos(app):
+    """Troca a view ``static`` do app por uma que serve os arquivos da memória."""
+    arquivos = carregar_estaticos(app.static_folder)
+    servir_do_disco = app.view_functions['static']
+
+    @app.url_defaults
+    def versao_estatico(endpoint, valores):
+        if endpoint == 'static' and 'v' not in valores:
+            arquivo = arquivos.get(valores.get('filename'))
+            if arquivo is not None:
+                valores['v'] = arquivo.versao
+
+    def servir_estatico(filename):
+        arquivo = arquivos.get(filename)
+        if arquivo is None:
+            return servir_do_disco(filename=filename)
+
+        codificacao = arquivo.escolher(request.accept_encodings)
+        resposta = Response(arquivo.variantes[codificacao], mimetype=arquivo.mimetype)
+        if codificacao != 'identity':
+            resposta.content_encoding = codificacao
+        if len(arquivo.variantes) > 1:
+            resposta.vary.add('Accept-Encoding')
+        resposta.set_etag(f'{arquivo.versao}-{codificacao}')
+        if request.args.get('v') == arquivo.versao:
+            resposta.cache_control.public = True
+            resposta.cache_control.max_age = UM_ANO
+            resposta.cache_control.immutable = True
+        else:
+            # URL sem a versão certa: o navegador revalida pelo ETag
+            resposta.cache_control.no_cache = True
+        return resposta.make_conditional(request)
+
+    app.view_functions['static'] = servir_estatico
+    app.extensions['estaticos'] = arquivos
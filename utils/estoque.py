@@ -0,0 +1,101 @@
+from sqlalchemy import bindparam, text
+
+from models import db, MovimentoEstoque, Produto
+from utils.segundo_plano import TarefaPeriodica
+
+TIPOS = ('venda', 'ajuste', 'entrada')
+
+# Saída da venda só é gravada se o produto ainda está na versão lida pelo
+# checkout e o saldo disponível (consolidado + pendentes) cobre a quantidade;
+# a linha do produto não é alterada pelo checkout
+SQL_BAIXA_VENDA = text("""
+    INSERT INTO movimento_estoque (produto_id, quantidade, tipo, data, transacao_id, consolidado)
+    SELECT p.id, -:quantidade, 'venda', :data, :transacao_id, 0
+    FROM produto p
+    WHERE p.id = :produto_id AND p.versao = :versao
+      AND p.estoque + COALESCE((SELECT SUM(m.quantidade) FROM movimento_estoque m
+                                WHERE m.produto_id = p.id AND m.consolidado = 0), 0) >= :quantidade
+""").bindparams(bindparam('data', type_=db.DateTime))
+
+# As duas instruções rodam na mesma transação de escrita: nenhum movimento
+# novo entra entre a soma e a marcação, e quem lê vê antes ou depois, nunca o meio
+SQL_CONSOLIDAR = [
+    """UPDATE produto
+       SET estoque = estoque + (SELECT SUM(m.quantidade) FROM movimento_estoque m
+                                WHERE m.produto_id = produto.id AND m.consolidado = 0)
+       WHERE id IN (SELECT produto_id FROM movimento_estoque WHERE consolidado = 0)""",
+    "UPDATE movimento_estoque SET consolidado = 1 WHERE consolidado = 0",
+]
+
+
+def estoque_disponivel(produto_ids):
+    """Saldo disponível agora de cada produto, ``{produto_id: quantidade}``."""
+    linhas = db.session.query(Produto.id, Produto.estoque_disponivel).filter(Produto.id.in_(produto_ids))
+    return dict(linhas.all())
+
+
+def baixar_estoque_venda(quantidades, versoes, transacao_id, data):
+    """Grava as saídas da venda. Retorna False se algum produto mudou de versão
+    ou não tinha saldo.
+
+    Não faz commit: roda dentro da transação do checkout.
+    """
+    resultado = db.session.execute(SQL_BAIXA_VENDA, [
+        {'produto_id': produto_id, 'quantidade': quantidade, 'versao': versoes[produto_id],
+         'data': data, 'transacao_id': transacao_id}
+        for produto_id, quantidade in quantidades.items()
+    ])
+    return resultado.rowcount == len(quantidades)
+
+
+def registrar_movimento(produto_id, quantidade, tipo, transacao_id=None):
+    if tipo not in TIPOS:
+        raise ValueError(f'Tipo de movimento inválido: {tipo}')
+    movimento = MovimentoEstoque(produto_id=produto_id, quantidade=quantidade, tipo=tipo, transacao_id=transacao_id)
+    db.session.add(movimento)
+    return movimento
+
+
+def ajustar_estoque(produto, contagem):
+    """Registra um ajuste que leva o saldo disponível do produto a ``contagem``."""
+    diferenca = contagem - estoque_disponivel([produto.id]).get(produto.id, 0)
+    if diferenca:
+        return registrar_movimento(produto.id, diferenca, 'ajuste')
+    return None
+
+
+def historico_estoque(produto_id, limite=100):
+    return MovimentoEstoque.query.filter_by(produto_id=produto_id).order_by(
+        MovimentoEstoque.id.desc()
+    ).limit(limite).all()
+
+
+def consolidar_movimentos():
+    """Soma os movimentos pendentes em Produto.estoque e os marca como consolidados.
+
+    O saldo disponível não muda; só encurta a soma dos pendentes. Retorna a
+    quantidade de movimentos consolidados.
+    """
+    with db.engine.begin() as conexao:
+        conexao.exec_driver_sql(SQL_CONSOLIDAR[0])
+        return conexao.exec_driver_sql(SQL_CONSOLIDAR[1]).rowcount
+
+
+class ConsolidadorEstoque(TarefaPeriodica):
+    """Thread em segundo plano que consolida o livro de estoque periodicamente."""
+
+    nome = 'consolidador-estoque'
+    mensagem_erro = 'Erro ao consolidar o estoque'
+
+    def __init__(self):
+        super().__init__(intervalo=60)
+
+    def configurar(self, app):
+        self.intervalo = app.config.get('ESTOQUE_CONSOLIDACAO_SEGUNDOS', 60)
+        super().configurar(app)
+
+    def executar(self):
+        consolidar_movimentos()
+
+
+consolidador_estoque = ConsolidadorEstoque()
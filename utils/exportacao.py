@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models import Produto, Transacao, ItemTransacao
+
+TAMANHO_LOTE = 1000
+
+COLUNAS = [
+    'transacao_id', 'data', 'metodo_pagamento', 'valor_transacao',
+    'item_id', 'produto_id', 'codigo_barras', 'produto', 'quantidade', 'preco', 'subtotal',
+]
+
+
+def consulta_itens(inicio=None, fim=None, metodo_pagamento=None):
+    consulta = select(
+        Transacao.id, Transacao.data, Transacao.metodo_pagamento, Transacao.valor,
+        ItemTransacao.id, ItemTransacao.produto_id, Produto.codigo_barras, Produto.nome,
+        ItemTransacao.quantidade, ItemTransacao.preco,
+    ).select_from(Transacao).join(
+        ItemTransacao, ItemTransacao.transacao_id == Transacao.id
+    ).outerjoin(Produto, Produto.id == ItemTransacao.produto_id)
+    if inicio is not None:
+        consulta = consulta.where(Transacao.data >= inicio)
+    if fim is not None:
+        consulta = consulta.where(Transacao.data < fim)
+    if metodo_pagamento is not None:
+        consulta = consulta.where(Transacao.metodo_pagamento == metodo_pagamento)
+    return consulta.order_by(Transacao.data, Transacao.id, ItemTransacao.id)
+
+
+def _linhas(conexao, filtros):
+    # stream_results + yield_per: o cursor é lido em lotes, nunca o resultado inteiro
+    resultado = conexao.execution_options(stream_results=True, yield_per=TAMANHO_LOTE).execute(
+        consulta_itens(**filtros)
+    )
+    for linha in resultado:
+        yield list(linha) + [linha[8] * linha[9]]
+
+
+def exportar_csv(conexao, **filtros):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUNAS)
+    for numero, linha in enumerate(_linhas(conexao, filtros), start=1):
+        linha[1] = linha[1].isoformat(sep=' ')
+        escritor.writerow(linha)
+        if numero % TAMANHO_LOTE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def exportar_ndjson(conexao, **filtros):
+    lote = []
+    for linha in _linhas(conexao, filtros):
+        linha[1] = linha[1].isoformat(sep=' ')
+        lote.append(json.dumps(dict(zip(COLUNAS, linha)), ensure_ascii=False, default=float))
+        if len(lote) == TAMANHO_LOTE:
+            yield '\n'.join(lote) + '\n'
+            lote = []
+    if lote:
+        yield '\n'.join(lote) + '\n'
+
+
+FORMATOS = {
+    'csv': (exportar_csv, 'text/csv; charset=utf-8'),
+    'ndjson': (exportar_ndjson, 'application/x-ndjson; charset=utf-8'),
+}
@@ -1,3 +1,5 @@
+import zlib
+
 from fpdf import FPDF
 
 def gerar_relatorio_pdf(dados, filename):
@@ -11,3 +13,72 @@ def gerar_relatorio_pdf(dados, filename):
     pdf.output(filename)
 
 
+# Página A4 em pontos, fonte Helvetica 10 com 14 pt entre linhas
+LARGURA_PAGINA = 595.28
+ALTURA_PAGINA = 841.89
+MARGEM = 40
+ALTURA_LINHA = 14
+LINHAS_POR_PAGINA = int((ALTURA_PAGINA - 2 * MARGEM) // ALTURA_LINHA)
+
+
+def _texto_pdf(texto):
+    texto = texto.encode('cp1252', errors='replace')
+    return texto.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def gerar_pdf_stream(linhas):
+    """Gera um PDF de texto página por página, como um gerador de bytes.
+
+    Ao contrário do FPDF, que monta o documento inteiro em memória, cada
+    página é escrita e descartada assim que enche; só os offsets dos objetos
+    ficam guardados até o final (para a tabela xref).
+    """
+    offsets = {}
+    paginas = []
+    posicao = 0
+
+    def escrever(numero, corpo):
+        nonlocal posicao
+        dados = b'%d 0 obj\n' % numero + corpo + b'\nendobj\n'
+        offsets[numero] = posicao
+        posicao += len(dados)
+        return dados
+
+    cabecalho = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    posicao = len(cabecalho)
+    yield cabecalho
+    yield escrever(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield escrever(3, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+    proximo_objeto = 4
+
+    def pagina(buffer):
+        nonlocal proximo_objeto
+        conteudo = b'BT /F1 10 Tf %d TL %d %.2f Td\n' % (ALTURA_LINHA, MARGEM, ALTURA_PAGINA - MARGEM)
+        conteudo += b'\n'.join(b'(' + _texto_pdf(linha) + b') Tj T*' for linha in buffer) + b'\nET'
+        conteudo = zlib.compress(conteudo)
+        numero_conteudo, numero_pagina = proximo_objeto, proximo_objeto + 1
+        proximo_objeto += 2
+        paginas.append(numero_pagina)
+        yield escrever(numero_conteudo, b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(conteudo) + conteudo + b'\nendstream')
+        yield escrever(numero_pagina, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>'
+        ) % (LARGURA_PAGINA, ALTURA_PAGINA, numero_conteudo))
+
+    buffer = []
+    for linha in linhas:
+        buffer.append(linha)
+        if len(buffer) == LINHAS_POR_PAGINA:
+            yield from pagina(buffer)
+            buffer = []
+    if buffer or not paginas:
+        yield from pagina(buffer)
+
+    kids = b' '.join(b'%d 0 R' % numero for numero in paginas)
+    yield escrever(2, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(paginas))
+
+    inicio_xref = posicao
+    xref = [b'xref\n0 %d\n' % proximo_objeto, b'0000000000 65535 f \n']
+    xref += [b'%010d 00000 n \n' % offsets[numero] for numero in range(1, proximo_objeto)]
+    yield b''.join(xref)
+    yield b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (proximo_objeto, inicio_xref)
@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from sqlalchemy.orm import selectinload
+
+from models import Transacao, ItemTransacao
+from utils.cache import CacheLRU
+from utils import resumos
+from utils.banco import sessao_leitura
+from utils.paginacao import pagina_por_cursor
+
+LIMITE_PAGINA = 200
+
+# Quantidade e soma por filtro; o checkout limpa o cache e o TTL cobre o resto
+totais_cache = CacheLRU(tamanho_max=32, ttl=60)
+
+
+def inicio_periodo(filtro):
+    hoje = date.today()
+    if filtro == 'hoje':
+        return hoje
+    if filtro == 'semana':
+        return hoje - timedelta(days=hoje.weekday())
+    if filtro == 'mes':
+        return hoje.replace(day=1)
+    return None
+
+
+def filtros_periodo(filtro):
+    inicio = inicio_periodo(filtro)
+    return [Transacao.data >= inicio] if inicio is not None else []
+
+
+def totais_periodo(filtro):
+    chave = (filtro, inicio_periodo(filtro))
+    totais = totais_cache.get(chave)
+    if totais is None:
+        totais = resumos.totais_periodo(inicio_periodo(filtro))
+        totais_cache.set(chave, totais)
+    return totais
+
+
+def invalidar_totais():
+    totais_cache.limpar()
+
+
+def pagina_transacoes(filtros, apos=None, antes=None, limite=LIMITE_PAGINA):
+    """Página de transações por cursor sobre (data, id), mais recentes primeiro,
+    já com os itens e produtos carregados. Veja ``paginacao.pagina_por_cursor``.
+    """
+    query = sessao_leitura().query(Transacao).filter(*filtros).options(
+        selectinload(Transacao.itens).selectinload(ItemTransacao.produto)
+    )
+    return pagina_por_cursor(query, Transacao.data, Transacao.id, apos, antes, limite)
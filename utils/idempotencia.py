@@ -0,0 +1,60 @@
+import json
+from datetime import datetime, timedelta
+
+from models import db, ChaveIdempotencia
+from utils.segundo_plano import TarefaPeriodica
+
+TAMANHO_CHAVE = 64
+
+
+def resposta_gravada(chave):
+    """Resposta gravada para a chave, ``(resultado, status_code)``, ou None."""
+    registro = db.session.get(ChaveIdempotencia, chave)
+    if registro is None:
+        return None
+    return json.loads(registro.resposta), registro.status_code
+
+
+def gravar_resposta(chave, status_code, resultado):
+    """Grava a resposta da chave na transação corrente, sem commit."""
+    db.session.add(ChaveIdempotencia(
+        chave=chave, status_code=status_code, resposta=json.dumps(resultado, ensure_ascii=False)
+    ))
+
+
+def chave_repetida(erro):
+    """Se o IntegrityError veio da chave primária de chave_idempotencia (outro
+    envio com a mesma chave gravou primeiro), e não de outra restrição."""
+    coluna = ChaveIdempotencia.__table__.c.chave
+    return f'UNIQUE constraint failed: {coluna.table.name}.{coluna.name}' in str(erro.orig)
+
+
+def limpar_chaves_expiradas(validade_horas):
+    """Apaga as chaves mais antigas que a validade. Retorna quantas foram apagadas."""
+    limite = datetime.now() - timedelta(hours=validade_horas)
+    with db.engine.begin() as conexao:
+        return conexao.execute(
+            ChaveIdempotencia.__table__.delete().where(ChaveIdempotencia.criada_em < limite)
+        ).rowcount
+
+
+class LimpezaIdempotencia(TarefaPeriodica):
+    """Thread em segundo plano que apaga as chaves de idempotência vencidas."""
+
+    nome = 'limpeza-idempotencia'
+    mensagem_erro = 'Erro ao limpar as chaves de idempotência'
+
+    def __init__(self):
+        super().__init__(intervalo=3600)
+        self.validade_horas = 72
+
+    def configurar(self, app):
+        self.intervalo = app.config.get('IDEMPOTENCIA_LIMPEZA_SEGUNDOS', 3600)
+        self.validade_horas = app.config.get('IDEMPOTENCIA_VALIDADE_HORAS', 72)
+        super().configurar(app)
+
+    def executar(self):
+        limpar_chaves_expiradas(self.validade_horas)
+
+
+limpeza_idempotencia = LimpezaIdempotencia()
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import uuid
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow é opcional: sem ele as miniaturas não são geradas
+    Image = None
+
+from utils.segundo_plano import FilaSegundoPlano
+
+LARGURAS_MINIATURA = (160, 480)
+EXTENSOES = {'.jpg', '.jpeg', '.png', '.webp', '.gif'}
+TAMANHO_BLOCO = 64 * 1024
+
+
+def salvar_imagem(arquivo, pasta):
+    """Salva o upload com o hash do conteúdo como nome e agenda as miniaturas.
+
+    Imagens iguais viram o mesmo arquivo. Retorna o nome salvo, ou None se a
+    extensão não for de imagem.
+    """
+    extensao = os.path.splitext(arquivo.filename or '')[1].lower()
+    if extensao not in EXTENSOES:
+        return None
+    extensao = '.jpg' if extensao == '.jpeg' else extensao
+
+    os.makedirs(pasta, exist_ok=True)
+    temporario = os.path.join(pasta, f'.upload-{uuid.uuid4().hex}')
+    resumo = hashlib.sha256()
+    try:
+        with open(temporario, 'wb') as destino:
+            for bloco in iter(lambda: arquivo.stream.read(TAMANHO_BLOCO), b''):
+                resumo.update(bloco)
+                destino.write(bloco)
+        nome = resumo.hexdigest()[:32] + extensao
+        caminho = os.path.join(pasta, nome)
+        if not os.path.exists(caminho):
+            os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+    fila_miniaturas.enfileirar(caminho)
+    return nome
+
+
+def nome_miniatura(nome, largura):
+    return f'{os.path.splitext(nome)[0]}_{largura}.webp'
+
+
+def gerar_miniaturas(caminho):
+    if Image is None:
+        return
+    pasta, nome = os.path.split(caminho)
+    with Image.open(caminho) as original:
+        original = original.convert('RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for largura in LARGURAS_MINIATURA:
+            destino = os.path.join(pasta, nome_miniatura(nome, largura))
+            if os.path.exists(destino):
+                continue
+            miniatura = original.copy()
+            miniatura.thumbnail((largura, largura * 4))
+            temporario = destino + '.parcial'
+            miniatura.save(temporario, 'WEBP', quality=80, method=4)
+            os.replace(temporario, destino)
+
+
+class FilaMiniaturas(FilaSegundoPlano):
+    """Gera as miniaturas em uma thread em segundo plano, fora da requisição."""
+
+    nome = 'fila-miniaturas'
+
+    def enfileirar(self, caminho):
+        if Image is None:
+            return
+        super().enfileirar(caminho)
+
+    def processar(self, caminho):
+        gerar_miniaturas(caminho)
+
+    def falhou(self, caminho, erro):
+        print(f"Erro ao gerar miniaturas de {caminho}: {erro}")
+
+
+fila_miniaturas = FilaMiniaturas()
+
+
+def eh_nome_por_hash(nome):
+    base = os.path.splitext(nome)[0].split('_')[0]
+    return len(base) == 32 and all(c in '0123456789abcdef' for c in base)
+
+
+def imagem_para_exibir(nome, pasta, largura=None):
+    """Nome do arquivo a servir: a miniatura da largura pedida, se já existir."""
+    # Cadastros antigos guardavam o caminho inteiro (static/imagens/...)
+    nome = os.path.basename(nome)
+    if largura is not None:
+        miniatura = nome_miniatura(nome, largura)
+        if os.path.exists(os.path.join(pasta, miniatura)):
+            return miniatura
+    return nome
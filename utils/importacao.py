@@ -0,0 +1,237 @@
+import csv
+from datetime import datetime
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+
+from models import db, Categoria, MovimentoEstoque, Produto
+from utils.banco import iniciar_transacao_escrita
+from utils.catalogo import invalidar_produto
+from utils.dinheiro import para_decimal
+
+TAMANHO_LOTE = 1000
+LIMITE_ERROS = 1000  # erros devolvidos linha a linha; o total é sempre contado
+
+COLUNAS_OBRIGATORIAS = ('codigo_barras', 'nome', 'preco', 'categoria')
+
+_tabela = Produto.__table__
+_TAMANHOS = {coluna: _tabela.c[coluna].type.length for coluna in ('codigo_barras', 'nome', 'descricao')}
+
+
+class ImportacaoInvalida(ValueError):
+    pass
+
+
+class LinhaInvalida(ValueError):
+    pass
+
+
+def _upsert_produtos():
+    # Um INSERT ... ON CONFLICT por lote (executemany). Produtos iguais ao
+    # arquivo não são tocados: nem a versão nem o cache mudam à toa
+    comando = insert_sqlite(_tabela)
+    novo = comando.excluded
+    return comando.on_conflict_do_update(
+        index_elements=[_tabela.c.codigo_barras],
+        set_={
+            'nome': novo.nome,
+            'descricao': func.coalesce(novo.descricao, _tabela.c.descricao),
+            'preco': novo.preco,
+            'categoria_id': novo.categoria_id,
+            'versao': _tabela.c.versao + 1,
+        },
+        where=(_tabela.c.nome != novo.nome)
+        | (func.coalesce(novo.descricao, _tabela.c.descricao).is_distinct_from(_tabela.c.descricao))
+        | (_tabela.c.preco != novo.preco)
+        | (_tabela.c.categoria_id != novo.categoria_id),
+    )
+
+
+def _ler_cabecalho(linhas):
+    try:
+        primeira = next(linhas)
+    except StopIteration:
+        raise ImportacaoInvalida('Arquivo vazio!')
+    # Planilhas em português costumam exportar com ";"
+    delimitador = ';' if primeira.count(';') > primeira.count(',') else ','
+    cabecalho = [coluna.strip().lower() for coluna in next(csv.reader([primeira], delimiter=delimitador))]
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in cabecalho]
+    if faltando:
+        raise ImportacaoInvalida(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+    return cabecalho, delimitador
+
+
+def _texto(valores, coluna, obrigatorio=False):
+    valor = (valores.get(coluna) or '').strip()
+    if obrigatorio and not valor:
+        raise LinhaInvalida(f'Coluna {coluna} vazia')
+    if len(valor) > _TAMANHOS.get(coluna, len(valor)):
+        raise LinhaInvalida(f'Coluna {coluna} com mais de {_TAMANHOS[coluna]} caracteres')
+    return valor or None
+
+
+def _validar_linha(valores):
+    codigo_barras = _texto(valores, 'codigo_barras', obrigatorio=True)
+    nome = _texto(valores, 'nome', obrigatorio=True)
+    descricao = _texto(valores, 'descricao')
+    categoria = _texto(valores, 'categoria', obrigatorio=True)
+    try:
+        preco = para_decimal(_texto(valores, 'preco', obrigatorio=True))
+    except ArithmeticError:
+        raise LinhaInvalida(f"Preço inválido: {valores.get('preco')}")
+    if not preco.is_finite() or preco < 0:
+        raise LinhaInvalida(f"Preço inválido: {valores.get('preco')}")
+    estoque = _texto(valores, 'estoque')
+    if estoque is not None:
+        try:
+            estoque = int(estoque)
+        except ValueError:
+            raise LinhaInvalida(f'Estoque inválido: {estoque}')
+        if estoque < 0:
+            raise LinhaInvalida(f'Estoque inválido: {estoque}')
+    return {
+        'codigo_barras': codigo_barras,
+        'nome': nome,
+        'descricao': descricao,
+        'preco': preco,
+        'estoque': estoque,
+        'categoria': categoria,
+    }
+
+
+def _gravar_lote(lote, categorias, resumo):
+    """Grava um lote já validado em uma transação: categorias novas, upsert
+    dos produtos e movimentos de estoque. Retorna ``{produto_id: codigo}`` dos
+    produtos que já existiam (para invalidar o cache depois do commit).
+    """
+    iniciar_transacao_escrita()
+
+    for linha in lote:
+        chave = linha['categoria'].casefold()
+        if chave not in categorias:
+            categoria = Categoria(nome=linha['categoria'])
+            db.session.add(categoria)
+            db.session.flush()
+            categorias[chave] = categoria.id
+            resumo['categorias_criadas'].append(categoria.nome)
+
+    codigos = [linha['codigo_barras'] for linha in lote]
+    # Saldo lido na mesma transação de escrita: nenhuma venda entra no meio
+    existentes = {
+        codigo: (produto_id, disponivel)
+        for produto_id, codigo, disponivel in db.session.execute(
+            select(Produto.id, Produto.codigo_barras, Produto.estoque_disponivel)
+            .where(Produto.codigo_barras.in_(codigos))
+        )
+    }
+
+    alterados = db.session.execute(_upsert_produtos(), [
+        {
+            'codigo_barras': linha['codigo_barras'],
+            'nome': linha['nome'],
+            'descricao': linha['descricao'],
+            'preco': linha['preco'],
+            'estoque': 0,
+            'categoria_id': categorias[linha['categoria'].casefold()],
+            'versao': 1,
+        }
+        for linha in lote
+    ]).rowcount
+    inseridos = len(lote) - len(existentes)
+
+    novos = [codigo for codigo in codigos if codigo not in existentes]
+    ids_novos = dict(
+        db.session.execute(
+            select(Produto.codigo_barras, Produto.id).where(Produto.codigo_barras.in_(novos))
+        ).all()
+    ) if novos else {}
+
+    # Estoque do arquivo entra no livro: entrada inicial ou ajuste até a contagem
+    agora = datetime.now()
+    movimentos = []
+    for linha in lote:
+        if linha['estoque'] is None:
+            continue
+        if linha['codigo_barras'] in existentes:
+            produto_id, disponivel = existentes[linha['codigo_barras']]
+            quantidade, tipo = linha['estoque'] - disponivel, 'ajuste'
+        else:
+            produto_id, quantidade, tipo = ids_novos[linha['codigo_barras']], linha['estoque'], 'entrada'
+        if quantidade:
+            movimentos.append({'produto_id': produto_id, 'quantidade': quantidade, 'tipo': tipo,
+                               'data': agora, 'consolidado': False})
+    if movimentos:
+        db.session.execute(insert(MovimentoEstoque.__table__), movimentos)
+
+    resumo['inseridos'] += inseridos
+    resumo['atualizados'] += alterados - inseridos
+    resumo['inalterados'] += len(existentes) - (alterados - inseridos)
+    resumo['movimentos_estoque'] += len(movimentos)
+    return {produto_id: codigo for codigo, (produto_id, _) in existentes.items()}
+
+
+def importar_produtos(arquivo, criar_categorias=False):
+    """Importa produtos de um CSV (texto), com upsert pelo código de barras.
+
+    O arquivo é lido e validado linha a linha e gravado em lotes de
+    ``TAMANHO_LOTE``, um commit por lote. Colunas: codigo_barras, nome, preco
+    e categoria (pelo nome), mais descricao e estoque opcionais; o estoque é
+    a contagem atual e vira movimento no livro de estoque. Linhas inválidas
+    não param a importação: vão para ``erros`` com o número da linha.
+    """
+    linhas = iter(arquivo)
+    try:
+        cabecalho, delimitador = _ler_cabecalho(linhas)
+    except UnicodeDecodeError:
+        raise ImportacaoInvalida('O arquivo precisa estar em UTF-8.')
+    categorias = {nome.casefold(): categoria_id for categoria_id, nome in db.session.query(Categoria.id, Categoria.nome)}
+    resumo = {'linhas': 0, 'inseridos': 0, 'atualizados': 0, 'inalterados': 0,
+              'movimentos_estoque': 0, 'categorias_criadas': [], 'erros': [], 'total_erros': 0}
+    vistos = {}
+    lote = []
+
+    def erro(numero, codigo_barras, mensagem):
+        resumo['total_erros'] += 1
+        if len(resumo['erros']) < LIMITE_ERROS:
+            resumo['erros'].append({'linha': numero, 'codigo_barras': codigo_barras, 'mensagem': mensagem})
+
+    def gravar():
+        try:
+            existentes = _gravar_lote(lote, categorias, resumo)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for produto_id, codigo_barras in existentes.items():
+            invalidar_produto(produto_id, codigo_barras)
+        lote.clear()
+
+    leitor = csv.reader(linhas, delimiter=delimitador)
+    try:
+        for campos in leitor:
+            if not any(campo.strip() for campo in campos):
+                continue
+            # Linha do arquivo onde o registro começa (a 1 é o cabeçalho)
+            numero = leitor.line_num + 1 - sum(campo.count('\n') for campo in campos)
+            resumo['linhas'] += 1
+            valores = dict(zip(cabecalho, campos))
+            try:
+                linha = _validar_linha(valores)
+                if linha['categoria'].casefold() not in categorias and not criar_categorias:
+                    raise LinhaInvalida(f"Categoria não encontrada: {linha['categoria']}")
+                if linha['codigo_barras'] in vistos:
+                    raise LinhaInvalida(f"Código de barras repetido no arquivo (linha {vistos[linha['codigo_barras']]})")
+            except LinhaInvalida as e:
+                erro(numero, (valores.get('codigo_barras') or '').strip() or None, str(e))
+                continue
+            vistos[linha['codigo_barras']] = numero
+            lote.append(linha)
+            if len(lote) == TAMANHO_LOTE:
+                gravar()
+    except UnicodeDecodeError:
+        raise ImportacaoInvalida(f'O arquivo precisa estar em UTF-8 (linha {leitor.line_num + 2}).')
+    except csv.Error as e:
+        raise ImportacaoInvalida(f'CSV inválido na linha {leitor.line_num + 1}: {e}')
+    if lote:
+        gravar()
+    return resumo
@@ -0,0 +1,199 @@
+import socket
+import string
+import time
+
+from models import db, Empresa, Transacao, ItemTransacao, Produto
+from utils.cache import CacheLRU
+from utils.segundo_plano import FilaSegundoPlano
+
+# Comandos ESC/POS usados no recibo
+COMANDOS = {
+    'INICIAR': b'\x1b@\x1bt\x02',  # reinicia e seleciona a página de código PC850
+    'CENTRO': b'\x1ba\x01',
+    'ESQUERDA': b'\x1ba\x00',
+    'NEGRITO': b'\x1bE\x01',
+    'NORMAL': b'\x1bE\x00',
+    'DUPLO': b'\x1d!\x11',
+    'SIMPLES': b'\x1d!\x00',
+    'CORTAR': b'\n\n\n\x1dV\x00',
+}
+
+CODIFICACAO = 'cp850'
+LARGURA = 48
+
+MODELO_CABECALHO = (
+    '{INICIAR}{CENTRO}{NEGRITO}{DUPLO}{empresa}{SIMPLES}{NORMAL}\n'
+    '{endereco}\n'
+    'Tel: {telefone}\n'
+    '{ESQUERDA}{separador}\n'
+    'Venda: {transacao_id}    {data}\n'
+    '{separador}\n'
+)
+MODELO_ITEM = '{nome}\n  {quantidade} x R$ {preco} = R$ {subtotal}\n'
+MODELO_RODAPE = (
+    '{separador}\n'
+    '{NEGRITO}TOTAL: R$ {total}{NORMAL}\n'
+    'Pagamento: {metodo_pagamento}\n'
+    '{CENTRO}Obrigado pela preferência!\n'
+    '{CORTAR}'
+)
+
+
+class ModeloRecibo:
+    """Modelo ESC/POS compilado uma única vez.
+
+    O texto é separado em pedaços fixos (já codificados em bytes, com os
+    comandos resolvidos) e nomes de campos; imprimir só junta os pedaços.
+    """
+
+    def __init__(self, modelo):
+        self.partes = []
+        for literal, campo, formato, _ in string.Formatter().parse(modelo):
+            if literal:
+                self.partes.append(literal.encode(CODIFICACAO, errors='replace'))
+            if campo is None:
+                continue
+            if campo in COMANDOS:
+                self.partes.append(COMANDOS[campo])
+            else:
+                self.partes.append((campo, formato))
+
+    def renderizar(self, dados):
+        saida = []
+        for parte in self.partes:
+            if isinstance(parte, bytes):
+                saida.append(parte)
+            else:
+                campo, formato = parte
+                saida.append(format(dados[campo], formato).encode(CODIFICACAO, errors='replace'))
+        return b''.join(saida)
+
+
+CABECALHO = ModeloRecibo(MODELO_CABECALHO)
+ITEM = ModeloRecibo(MODELO_ITEM)
+RODAPE = ModeloRecibo(MODELO_RODAPE)
+
+
+def montar_recibo(empresa, transacao, itens):
+    comum = {'separador': '-' * LARGURA}
+    partes = [CABECALHO.renderizar(dict(
+        comum,
+        empresa=empresa.nome if empresa else 'SmartCaixa',
+        endereco=empresa.endereco if empresa else '',
+        telefone=empresa.telefone if empresa else '',
+        transacao_id=transacao.id,
+        data=transacao.data.strftime('%d/%m/%Y %H:%M'),
+    ))]
+    for item, nome in itens:
+        partes.append(ITEM.renderizar({
+            'nome': (nome or f'Produto {item.produto_id}')[:LARGURA],
+            'quantidade': item.quantidade,
+            'preco': f'{item.preco:.2f}',
+            'subtotal': f'{item.preco * item.quantidade:.2f}',
+        }))
+    partes.append(RODAPE.renderizar(dict(
+        comum,
+        total=f'{transacao.valor:.2f}',
+        metodo_pagamento=transacao.metodo_pagamento,
+    )))
+    return b''.join(partes)
+
+
+class ImpressoraArquivo:
+    """Grava o recibo em um arquivo, pipe ou dispositivo (ex.: /dev/usb/lp0)."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+    def enviar(self, dados):
+        with open(self.caminho, 'ab') as destino:
+            destino.write(dados)
+
+
+class ImpressoraRede:
+    """Envia o recibo para uma impressora de rede (RAW, normalmente porta 9100)."""
+
+    def __init__(self, host, porta=9100, timeout=5):
+        self.host = host
+        self.porta = porta
+        self.timeout = timeout
+
+    def enviar(self, dados):
+        with socket.create_connection((self.host, self.porta), timeout=self.timeout) as conexao:
+            conexao.sendall(dados)
+
+
+def criar_impressora(destino):
+    """Cria a impressora a partir da configuração IMPRESSORA.
+
+    Formatos: ``arquivo:/caminho`` ou ``rede:host[:porta]``; vazio desativa a impressão.
+    """
+    if not destino:
+        return None
+    tipo, _, endereco = destino.partition(':')
+    if tipo == 'arquivo':
+        return ImpressoraArquivo(endereco)
+    if tipo == 'rede':
+        host, _, porta = endereco.partition(':')
+        return ImpressoraRede(host, int(porta or 9100))
+    raise ValueError(f'Impressora desconhecida: {destino}')
+
+
+class FilaImpressao(FilaSegundoPlano):
+    """Fila de recibos atendida por uma thread em segundo plano, com novas tentativas."""
+
+    nome = 'fila-impressao'
+
+    def __init__(self, tentativas=3, espera=1.0):
+        super().__init__()
+        self.impressora = None
+        self.tentativas = tentativas
+        self.espera = espera
+        self.situacoes = CacheLRU(tamanho_max=1000)
+        self._empresa = None
+
+    def configurar(self, app):
+        super().configurar(app)
+        self.impressora = criar_impressora(app.config.get('IMPRESSORA'))
+
+    def enfileirar(self, transacao_id):
+        if self.impressora is None:
+            self.situacoes.set(transacao_id, {'status': 'desativada', 'tentativas': 0})
+            return
+        self.situacoes.set(transacao_id, {'status': 'na_fila', 'tentativas': 0})
+        super().enfileirar(transacao_id)
+
+    def situacao(self, transacao_id):
+        return self.situacoes.get(transacao_id)
+
+    def _carregar_recibo(self, transacao_id):
+        with self.app.app_context():
+            if self._empresa is None:
+                self._empresa = Empresa.query.first()
+                if self._empresa is not None:
+                    db.session.expunge(self._empresa)
+            transacao = db.session.get(Transacao, transacao_id)
+            itens = db.session.query(ItemTransacao, Produto.nome).outerjoin(
+                Produto, Produto.id == ItemTransacao.produto_id
+            ).filter(ItemTransacao.transacao_id == transacao_id).order_by(ItemTransacao.id).all()
+            return montar_recibo(self._empresa, transacao, itens)
+
+    def processar(self, transacao_id):
+        recibo = self._carregar_recibo(transacao_id)
+        for tentativa in range(1, self.tentativas + 1):
+            try:
+                self.impressora.enviar(recibo)
+                self.situacoes.set(transacao_id, {'status': 'impresso', 'tentativas': tentativa})
+                break
+            except OSError as e:
+                self.situacoes.set(transacao_id, {'status': 'tentando', 'tentativas': tentativa, 'erro': str(e)})
+                if tentativa == self.tentativas:
+                    self.situacoes.set(transacao_id, {'status': 'erro', 'tentativas': tentativa, 'erro': str(e)})
+                else:
+                    time.sleep(self.espera * 2 ** (tentativa - 1))
+
+    def falhou(self, transacao_id, erro):
+        self.situacoes.set(transacao_id, {'status': 'erro', 'tentativas': 0, 'erro': str(erro)})
+
+
+fila_impressao = FilaImpressao()
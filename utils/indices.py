@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, tuple_
+
+from models import db, Atividade, ChaveIdempotencia, MovimentoEstoque, Produto, Transacao, ItemTransacao
+from utils.turno import consulta_totais_do_turno, consulta_totais_por_metodo
+
+
+def criar_indices():
+    # create_all só cria índices junto com a tabela; bancos já existentes
+    # (sem Alembic) recebem aqui os índices declarados nos modelos
+    with db.engine.begin() as conexao:
+        for tabela in db.metadata.sorted_tables:
+            for indice in tabela.indexes:
+                indice.create(conexao, checkfirst=True)
+
+
+def _consultas_verificadas():
+    agora = datetime.now()
+    inicio = agora - timedelta(days=30)
+    # (rota, descrição, consulta, índice esperado no plano)
+    return [
+        ('transacoes', 'página por período',
+         select(Transacao).where(Transacao.data >= inicio)
+         .order_by(Transacao.data.desc(), Transacao.id.desc()).limit(201),
+         'ix_transacao_data_id'),
+        ('transacoes', 'página seguinte pelo cursor',
+         select(Transacao).where(Transacao.data >= inicio, tuple_(Transacao.data, Transacao.id) < (agora, 1000))
+         .order_by(Transacao.data.desc(), Transacao.id.desc()).limit(201),
+         'ix_transacao_data_id'),
+        ('transacoes', 'itens das transações da página',
+         select(ItemTransacao).where(ItemTransacao.transacao_id.in_([1, 2, 3])),
+         'ix_item_transacao_transacao_id'),
+        ('fechamento', 'conferência dos totais do turno',
+         consulta_totais_do_turno(1),
+         'ix_transacao_turno_id_metodo_pagamento'),
+        ('fechamento', 'totais por forma de pagamento sem turno aberto',
+         consulta_totais_por_metodo(inicio, agora),
+         'ix_transacao_data_id'),
+        ('produtos', 'produtos de uma categoria',
+         select(Produto).where(Produto.categoria_id == 1),
+         'ix_produto_categoria_id'),
+        ('produto_por_codigo_barras', 'leitura do código de barras',
+         select(Produto).where(Produto.codigo_barras == '7890000000000'),
+         'sqlite_autoindex_produto_1'),
+        ('estoque', 'vendas de um produto',
+         select(ItemTransacao).where(ItemTransacao.produto_id == 1),
+         'ix_item_transacao_produto_id'),
+        ('finalizar_compra', 'saldo pendente no livro de estoque',
+         select(db.func.sum(MovimentoEstoque.quantidade)).where(
+             MovimentoEstoque.produto_id == 1, MovimentoEstoque.consolidado == False),
+         'ix_movimento_estoque_pendente'),
+        ('movimentos_estoque', 'histórico de um produto',
+         select(MovimentoEstoque).where(MovimentoEstoque.produto_id == 1)
+         .order_by(MovimentoEstoque.id.desc()).limit(100),
+         'ix_movimento_estoque_produto_id_id'),
+        ('limpar-idempotencia', 'chaves vencidas',
+         select(ChaveIdempotencia.chave).where(ChaveIdempotencia.criada_em < inicio),
+         'ix_chave_idempotencia_criada_em'),
+        ('auditoria', 'atividades do período, mais recentes primeiro',
+         select(Atividade).where(Atividade.data >= inicio)
+         .order_by(Atividade.data.desc(), Atividade.id.desc()).limit(200),
+         'ix_atividade_data_id'),
+        ('auditoria', 'atividades de um usuário',
+         select(Atividade).where(Atividade.usuario == 'admin', Atividade.data >= inicio)
+         .order_by(Atividade.data.desc(), Atividade.id.desc()).limit(200),
+         'ix_atividade_usuario_data_id'),
+    ]
+
+
+def verificar_planos():
+    """Roda EXPLAIN QUERY PLAN nas consultas das rotas e confere os índices usados.
+
+    Retorna uma lista de ``(rota, descricao, indice, ok, plano)``.
+    """
+    conexao = db.session.connection()
+    resultados = []
+    for rota, descricao, consulta, indice in _consultas_verificadas():
+        compilada = consulta.compile(dialect=conexao.dialect, compile_kwargs={'render_postcompile': True})
+        parametros = tuple(
+            str(valor) if isinstance(valor, datetime) else valor
+            for valor in (compilada.params[nome] for nome in compilada.positiontup)
+        )
+        linhas = conexao.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilada}', parametros).all()
+        plano = '\n'.join(linha[-1] for linha in linhas)
+        ok = f'INDEX {indice}' in plano
+        resultados.append((rota, descricao, indice, ok, plano))
+    return resultados
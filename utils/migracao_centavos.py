@@ -0,0 +1,71 @@
+from sqlalchemy.schema import CreateTable
+
+from models import db
+from utils.busca_produtos import criar_indice_busca
+from utils.dinheiro import Centavos
+from utils.indices import criar_indices
+from utils.resumos import reconstruir_resumos
+
+# Bancos criados antes dos centavos têm as colunas de dinheiro como FLOAT. O
+# SQLite não altera o tipo de uma coluna, então cada tabela é refeita: cria a
+# nova, copia multiplicando por 100, apaga a antiga e renomeia.
+
+
+def _colunas_declaradas(conexao, tabela):
+    return {
+        linha[1]: linha[2].upper()
+        for linha in conexao.exec_driver_sql(f'PRAGMA table_info("{tabela.name}")')
+    }
+
+
+def tabelas_pendentes(conexao):
+    """``[(tabela, colunas_existentes, colunas_a_converter)]`` ainda em FLOAT."""
+    pendentes = []
+    for tabela in db.metadata.sorted_tables:
+        dinheiro = [coluna.name for coluna in tabela.columns if isinstance(coluna.type, Centavos)]
+        if not dinheiro:
+            continue
+        declaradas = _colunas_declaradas(conexao, tabela)
+        converter = [nome for nome in dinheiro if nome in declaradas and declaradas[nome] != 'INTEGER']
+        if converter:
+            existentes = [coluna.name for coluna in tabela.columns if coluna.name in declaradas]
+            pendentes.append((tabela, existentes, converter))
+    return pendentes
+
+
+def _refazer_tabela(conexao, tabela, existentes, converter):
+    temporaria = f'{tabela.name}_centavos'
+    nova = tabela.to_metadata(db.metadata, name=temporaria)
+    try:
+        conexao.execute(CreateTable(nova))
+    finally:
+        db.metadata.remove(nova)
+
+    colunas = ', '.join(f'"{nome}"' for nome in existentes)
+    valores = ', '.join(
+        f'CAST(ROUND("{nome}" * 100) AS INTEGER)' if nome in converter else f'"{nome}"'
+        for nome in existentes
+    )
+    conexao.exec_driver_sql(f'INSERT INTO "{temporaria}" ({colunas}) SELECT {valores} FROM "{tabela.name}"')
+    conexao.exec_driver_sql(f'DROP TABLE "{tabela.name}"')
+    conexao.exec_driver_sql(f'ALTER TABLE "{temporaria}" RENAME TO "{tabela.name}"')
+
+
+def migrar_para_centavos():
+    """Converte as colunas de dinheiro em FLOAT para centavos inteiros.
+
+    Tudo em uma transação; tabelas já convertidas são ignoradas, então pode
+    rodar em todo início. Retorna os nomes das tabelas convertidas.
+    """
+    with db.engine.begin() as conexao:
+        pendentes = tabelas_pendentes(conexao)
+        for tabela, existentes, converter in pendentes:
+            _refazer_tabela(conexao, tabela, existentes, converter)
+
+    if pendentes:
+        # DROP TABLE levou junto os índices e os gatilhos da busca
+        criar_indices()
+        criar_indice_busca()
+        # Os resumos voltam a ser a soma exata dos itens já em centavos
+        reconstruir_resumos()
+    return [tabela.name for tabela, _, _ in pendentes]
@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+FORMATO_CURSOR = '%Y%m%d%H%M%S%f'
+
+
+def codificar_cursor(data, registro_id):
+    return f"{data.strftime(FORMATO_CURSOR)}-{registro_id}"
+
+
+def decodificar_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        data, registro_id = cursor.split('-')
+        return datetime.strptime(data, FORMATO_CURSOR), int(registro_id)
+    except ValueError:
+        return None
+
+
+def pagina_por_cursor(query, coluna_data, coluna_id, apos=None, antes=None, limite=200):
+    """Página por cursor (seek) sobre ``(coluna_data, coluna_id)``, mais recentes primeiro.
+
+    ``query`` já traz o modelo, os filtros e as opções de carga. ``apos``
+    avança para registros mais antigos e ``antes`` volta para os mais novos.
+    O custo é o mesmo em qualquer profundidade; precisa de um índice em
+    (data, id). Retorna ``(registros, cursor_anterior, cursor_proximo)``.
+    """
+    chave = tuple_(coluna_data, coluna_id)
+    posicao_antes = decodificar_cursor(antes)
+    posicao_apos = decodificar_cursor(apos)
+    if posicao_antes is not None:
+        query = query.filter(chave > posicao_antes).order_by(coluna_data.asc(), coluna_id.asc())
+    else:
+        if posicao_apos is not None:
+            query = query.filter(chave < posicao_apos)
+        query = query.order_by(coluna_data.desc(), coluna_id.desc())
+
+    # Um registro a mais diz se existe outra página nessa direção
+    registros = query.limit(limite + 1).all()
+    mais = len(registros) > limite
+    registros = registros[:limite]
+
+    if posicao_antes is not None:
+        registros.reverse()
+        tem_anterior, tem_proximo = mais, True
+    else:
+        tem_anterior, tem_proximo = posicao_apos is not None, mais
+
+    if not registros:
+        return registros, None, None
+
+    def cursor(registro):
+        return codificar_cursor(getattr(registro, coluna_data.key), getattr(registro, coluna_id.key))
+
+    return registros, cursor(registros[0]) if tem_anterior else None, cursor(registros[-1]) if tem_proximo else None
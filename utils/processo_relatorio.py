@@ -0,0 +1,38 @@
+import os
+
+from sqlalchemy import create_engine
+
+from utils.banco import registrar_pragmas
+from utils.gerar_pdf import gerar_pdf_stream, gerar_relatorio_pdf
+from utils.relatorios import linhas_relatorio
+
+# Funções executadas nos processos de relatório. Com spawn cada processo
+# importa este módulo do zero: ele não pode importar o app.py, senão cada
+# processo sobe o servidor inteiro (rotas, caches e threads de fundo).
+
+
+def _gravar_atomico(destino, escrever):
+    temporario = destino + '.parcial'
+    try:
+        escrever(temporario)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+def executar_relatorio_transacoes(url_banco, pragmas, parametros, destino):
+    engine = create_engine(url_banco)
+    registrar_pragmas(engine, pragmas, somente_leitura=True)
+    try:
+        def escrever(caminho):
+            with engine.connect() as conexao, open(caminho, 'wb') as arquivo:
+                for pedaco in gerar_pdf_stream(linhas_relatorio(conexao, **parametros)):
+                    arquivo.write(pedaco)
+        _gravar_atomico(destino, escrever)
+    finally:
+        engine.dispose()
+
+
+def executar_relatorio_fechamento(dados, destino):
+    _gravar_atomico(destino, lambda caminho: gerar_relatorio_pdf(dados, caminho))
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import Transacao
+
+TAMANHO_LOTE = 1000
+
+
+def parametros_relatorio(form):
+    """Lê os filtros do relatório (inicio, fim, metodo_pagamento) de um formulário."""
+    def data(campo):
+        valor = form.get(campo)
+        return datetime.strptime(valor, '%Y-%m-%d') if valor else None
+
+    fim = data('fim')
+    return {
+        'inicio': data('inicio'),
+        # O dia final entra inteiro no relatório
+        'fim': fim + timedelta(days=1) if fim else None,
+        'metodo_pagamento': form.get('metodo_pagamento') or None,
+    }
+
+
+def consulta_transacoes(inicio=None, fim=None, metodo_pagamento=None):
+    consulta = select(Transacao.data, Transacao.valor, Transacao.metodo_pagamento)
+    if inicio is not None:
+        consulta = consulta.where(Transacao.data >= inicio)
+    if fim is not None:
+        consulta = consulta.where(Transacao.data < fim)
+    if metodo_pagamento is not None:
+        consulta = consulta.where(Transacao.metodo_pagamento == metodo_pagamento)
+    return consulta.order_by(Transacao.data, Transacao.id)
+
+
+def linhas_relatorio(conexao, inicio=None, fim=None, metodo_pagamento=None):
+    """Gera as linhas do relatório lendo o banco em lotes (memória constante)."""
+    resultado = conexao.execution_options(yield_per=TAMANHO_LOTE).execute(
+        consulta_transacoes(inicio, fim, metodo_pagamento)
+    )
+    total = 0
+    quantidade = 0
+    for data, valor, metodo in resultado:
+        total += valor
+        quantidade += 1
+        yield f"{data} - {valor} - {metodo}"
+    yield f"Total: {quantidade} transações - R$ {total:.2f}"
@@ -0,0 +1,107 @@
+from collections import defaultdict
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, ResumoVendaHora, ResumoVendaProdutoDia, ResumoVendaCategoriaDia, Transacao
+
+
+def _upsert_somando(modelo, chaves, linhas):
+    # INSERT ... ON CONFLICT DO UPDATE somando os contadores à linha existente
+    tabela = modelo.__table__
+    stmt = sqlite_insert(tabela)
+    somas = {
+        coluna.name: coluna + stmt.excluded[coluna.name]
+        for coluna in tabela.columns if coluna.name not in chaves
+    }
+    db.session.execute(stmt.on_conflict_do_update(index_elements=chaves, set_=somas), linhas)
+
+
+def acumular_venda(transacao, itens, categorias):
+    """Soma a venda aos resumos por hora, produto e categoria.
+
+    Deve ser chamada antes do commit da venda, para que tudo seja gravado na
+    mesma transação. ``categorias`` mapeia produto_id -> categoria_id.
+    """
+    hora = transacao.data.replace(minute=0, second=0, microsecond=0)
+    dia = transacao.data.date()
+
+    por_produto = defaultdict(lambda: [0, 0])
+    por_categoria = defaultdict(lambda: [0, 0])
+    for item in itens:
+        valor = item['preco'] * item['quantidade']
+        for acumulado in (por_produto[int(item['id'])], por_categoria[categorias[int(item['id'])]]):
+            acumulado[0] += item['quantidade']
+            acumulado[1] += valor
+
+    _upsert_somando(ResumoVendaHora, ['hora', 'metodo_pagamento'], [{
+        'hora': hora,
+        'metodo_pagamento': transacao.metodo_pagamento,
+        'quantidade_vendas': 1,
+        'quantidade_itens': sum(item['quantidade'] for item in itens),
+        'valor_total': transacao.valor,
+    }])
+    _upsert_somando(ResumoVendaProdutoDia, ['dia', 'produto_id'], [
+        {'dia': dia, 'produto_id': produto_id, 'quantidade': quantidade, 'valor_total': valor}
+        for produto_id, (quantidade, valor) in por_produto.items()
+    ])
+    _upsert_somando(ResumoVendaCategoriaDia, ['dia', 'categoria_id'], [
+        {'dia': dia, 'categoria_id': categoria_id, 'quantidade': quantidade, 'valor_total': valor}
+        for categoria_id, (quantidade, valor) in por_categoria.items()
+    ])
+
+
+# O formato das chaves segue o que o SQLAlchemy grava no SQLite para DateTime e Date
+SQL_RECONSTRUIR = [
+    "DELETE FROM resumo_venda_hora",
+    "DELETE FROM resumo_venda_produto_dia",
+    "DELETE FROM resumo_venda_categoria_dia",
+    """INSERT INTO resumo_venda_hora (hora, metodo_pagamento, quantidade_vendas, quantidade_itens, valor_total)
+       SELECT strftime('%Y-%m-%d %H:00:00.000000', t.data), t.metodo_pagamento,
+              COUNT(*), COALESCE(SUM(i.quantidade), 0), SUM(t.valor)
+       FROM transacao t
+       LEFT JOIN (SELECT transacao_id, SUM(quantidade) AS quantidade
+                  FROM item_transacao GROUP BY transacao_id) i ON i.transacao_id = t.id
+       GROUP BY 1, 2""",
+    """INSERT INTO resumo_venda_produto_dia (dia, produto_id, quantidade, valor_total)
+       SELECT date(t.data), i.produto_id, SUM(i.quantidade), SUM(i.quantidade * i.preco)
+       FROM item_transacao i
+       JOIN transacao t ON t.id = i.transacao_id
+       GROUP BY 1, 2""",
+    """INSERT INTO resumo_venda_categoria_dia (dia, categoria_id, quantidade, valor_total)
+       SELECT date(t.data), p.categoria_id, SUM(i.quantidade), SUM(i.quantidade * i.preco)
+       FROM item_transacao i
+       JOIN transacao t ON t.id = i.transacao_id
+       JOIN produto p ON p.id = i.produto_id
+       GROUP BY 1, 2""",
+]
+
+
+def reconstruir_resumos():
+    """Recalcula todos os resumos a partir do histórico, em uma única transação."""
+    try:
+        for sql in SQL_RECONSTRUIR:
+            db.session.execute(text(sql))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def garantir_resumos():
+    # Banco com vendas anteriores aos resumos: preenche uma vez
+    if db.session.query(ResumoVendaHora.hora).first() is None and db.session.query(Transacao.id).first() is not None:
+        reconstruir_resumos()
+
+
+def totais_periodo(inicio=None, fim=None):
+    """Quantidade de vendas e valor total no período, lidos dos resumos por hora."""
+    query = db.session.query(
+        db.func.coalesce(db.func.sum(ResumoVendaHora.quantidade_vendas), 0),
+        db.func.coalesce(db.func.sum(ResumoVendaHora.valor_total), 0)
+    )
+    if inicio is not None:
+        query = query.filter(ResumoVendaHora.hora >= inicio)
+    if fim is not None:
+        query = query.filter(ResumoVendaHora.hora < fim)
+    return tuple(query.one())
@@ -0,0 +1,98 @@
+import multiprocessing
+import queue
+import threading
+import time
+
+
+class ThreadSegundoPlano:
+    """Base dos trabalhos do servidor que rodam em uma thread daemon própria.
+
+    A thread é criada por ``iniciar`` e recriada se tiver morrido. A subclasse
+    implementa ``_trabalhar``, o laço da thread.
+    """
+
+    nome = None
+
+    def __init__(self):
+        self.app = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def configurar(self, app):
+        self.app = app
+
+    def iniciar(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # Processos de relatório (spawn) importam o app de novo: só o servidor roda as threads
+        if multiprocessing.current_process().name != 'MainProcess':
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._trabalhar, name=self.nome, daemon=True)
+                self._thread.start()
+
+    def _trabalhar(self):
+        raise NotImplementedError
+
+
+class TarefaPeriodica(ThreadSegundoPlano):
+    """Roda ``executar`` no contexto do app a cada ``intervalo`` segundos (0 desliga).
+
+    ``configurar`` não inicia a thread: quem inicia é o servidor, chamando
+    ``iniciar``. Assim comandos do CLI e o processo do reloader não a rodam.
+    """
+
+    mensagem_erro = 'Erro na tarefa periódica'
+
+    def __init__(self, intervalo):
+        super().__init__()
+        self.intervalo = intervalo
+
+    def iniciar(self):
+        if self.intervalo:
+            super().iniciar()
+
+    def executar(self):
+        raise NotImplementedError
+
+    def _trabalhar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                with self.app.app_context():
+                    self.executar()
+            except Exception as e:
+                print(f"{self.mensagem_erro}: {e}")
+
+
+class FilaSegundoPlano(ThreadSegundoPlano):
+    """Fila atendida por uma thread, iniciada quando chega o primeiro item.
+
+    A subclasse implementa ``processar(item)``; o erro de um item vai para
+    ``falhou`` e não para a fila.
+    """
+
+    def __init__(self, tamanho_max=0):
+        super().__init__()
+        self._fila = queue.Queue(maxsize=tamanho_max)
+
+    def enfileirar(self, item):
+        self._fila.put(item)
+        self.iniciar()
+
+    def processar(self, item):
+        raise NotImplementedError
+
+    def falhou(self, item, erro):
+        print(f"Erro ao processar {item} na fila {self.nome}: {erro}")
+
+    def _trabalhar(self):
+        while True:
+            item = self._fila.get()
+            try:
+                self.processar(item)
+            except Exception as e:
+                self.falhou(item, e)
+            finally:
+                self._fila.task_done()
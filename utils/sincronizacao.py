@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ChaveIdempotencia
+from utils.banco import iniciar_transacao_escrita
+from utils.idempotencia import TAMANHO_CHAVE, chave_repetida, gravar_resposta
+from utils.venda import (
+    ConflitoVenda, TENTATIVAS_VENDA, VendaInvalida, conferir_pagamento, esperar_nova_tentativa,
+    gravar_venda, invalidar_caches_venda, preparar_carrinho
+)
+
+LIMITE_LOTE = 500
+
+
+class LoteInvalido(ValueError):
+    pass
+
+
+def _data_venda(valor):
+    # Hora em que a venda foi feita no terminal (ISO 8601); com fuso, vira hora local
+    if not valor:
+        return None
+    try:
+        data = datetime.fromisoformat(valor)
+    except (TypeError, ValueError):
+        raise VendaInvalida('Data da venda inválida!')
+    if data.tzinfo is not None:
+        data = data.astimezone().replace(tzinfo=None)
+    return data
+
+
+def _registrar_venda_do_lote(chave, venda):
+    """Grava uma venda do lote e a sua chave no mesmo SAVEPOINT.
+
+    Retorna ``(resultado, codigos)``, ou None se a chave já tinha sido gravada
+    por outra requisição (a venda então é desfeita pelo SAVEPOINT). Qualquer
+    outro IntegrityError é um erro de verdade e sobe.
+    """
+    try:
+        carrinho, quantidades = preparar_carrinho(venda.get('carrinho'))
+        conferir_pagamento(carrinho, venda.get('pagamento'), venda.get('valor_recebido'))
+        data = _data_venda(venda.get('data'))
+        for tentativa in range(1, TENTATIVAS_VENDA + 1):
+            try:
+                with db.session.begin_nested():
+                    transacao_id, codigos = gravar_venda(
+                        carrinho, quantidades, venda.get('pagamento'), data, conferir_precos=False
+                    )
+                    resultado = {'chave': chave, 'status': 'success', 'transacao_id': transacao_id}
+                    gravar_resposta(chave, 200, resultado)
+                    db.session.flush()
+                return resultado, codigos
+            except ConflitoVenda:
+                if tentativa == TENTATIVAS_VENDA:
+                    raise
+                esperar_nova_tentativa(tentativa)
+    except IntegrityError as e:
+        if chave_repetida(e):
+            return None
+        raise
+    except (KeyError, TypeError, ValueError, ArithmeticError) as e:
+        # Dado ruim em uma venda (VendaInvalida é um ValueError) é recusado só
+        # nela: o lote segue e a fila do terminal não trava nessa venda.
+        # A recusa também fica gravada: o reenvio recebe a mesma resposta
+        mensagem = str(e) if isinstance(e, VendaInvalida) else 'Venda inválida!'
+        resultado = {'chave': chave, 'status': 'error', 'message': mensagem}
+        status_code = 409 if isinstance(e, ConflitoVenda) else 400
+        try:
+            with db.session.begin_nested():
+                gravar_resposta(chave, status_code, resultado)
+                db.session.flush()
+        except IntegrityError as erro:
+            if chave_repetida(erro):
+                return None
+            raise
+        return resultado, {}
+
+
+def sincronizar_vendas(vendas):
+    """Registra um lote de vendas feitas no terminal, em uma única transação.
+
+    Cada venda traz uma ``chave`` gerada pelo terminal e roda no seu próprio
+    SAVEPOINT: uma venda recusada não desfaz as outras. Chaves já conhecidas
+    devolvem o resultado da primeira vez. Retorna a lista de resultados, na
+    ordem das vendas recebidas.
+    """
+    if not isinstance(vendas, list) or not vendas:
+        raise LoteInvalido('Nenhuma venda enviada!')
+    if len(vendas) > LIMITE_LOTE:
+        raise LoteInvalido(f'No máximo {LIMITE_LOTE} vendas por lote!')
+    chaves = [venda.get('chave') if isinstance(venda, dict) else None for venda in vendas]
+    if any(not isinstance(chave, str) or not 0 < len(chave) <= TAMANHO_CHAVE for chave in chaves):
+        raise LoteInvalido('Toda venda precisa de uma chave de idempotência!')
+
+    resultados = []
+    codigos = {}
+    vistas = set()
+    repetidas = []
+    try:
+        iniciar_transacao_escrita()
+        # Uma consulta para todas as chaves já vistas
+        conhecidas = {
+            chave for (chave,) in db.session.query(ChaveIdempotencia.chave)
+            .filter(ChaveIdempotencia.chave.in_(set(chaves)))
+        }
+        for chave, venda in zip(chaves, vendas):
+            gravada = None
+            if chave not in conhecidas and chave not in vistas:
+                vistas.add(chave)
+                gravada = _registrar_venda_do_lote(chave, venda)
+            if gravada is None:
+                resultados.append(None)
+                repetidas.append((len(resultados) - 1, chave))
+                continue
+            resultado, codigos_venda = gravada
+            codigos.update(codigos_venda)
+            resultados.append(dict(resultado, repetida=False))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    invalidar_caches_venda(codigos)
+
+    # Repetições devolvem o que foi gravado na primeira vez (a chave pode ter
+    # sido gravada pelo checkout, cuja resposta não traz a chave)
+    if repetidas:
+        gravadas = {
+            registro.chave: json.loads(registro.resposta)
+            for registro in ChaveIdempotencia.query.filter(
+                ChaveIdempotencia.chave.in_({chave for _, chave in repetidas})
+            )
+        }
+        for posicao, chave in repetidas:
+            # Chave apagada pela limpeza entre a leitura e aqui: a venda já foi recebida
+            gravada = gravadas.get(chave, {'status': 'error', 'message': 'Venda já recebida; o resultado não está mais disponível.'})
+            resultados[posicao] = dict(gravada, chave=chave, repetida=True)
+    return resultados
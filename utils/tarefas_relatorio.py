@@ -0,0 +1,130 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.cache import CacheLRU
+from utils.processo_relatorio import executar_relatorio_fechamento, executar_relatorio_transacoes
+
+# Os PDFs são gerados em processos separados, fora das threads que atendem o PDV.
+# Cada tarefa é identificada pelo hash dos seus parâmetros: pedidos iguais
+# reaproveitam a mesma tarefa ou o arquivo já gerado em disco. Tarefas
+# concluídas saem de ``_tarefas``: o PDF em disco ou ``_erros`` responde por elas.
+_executor = None
+_tarefas = {}
+_erros = CacheLRU(100, ttl=3600)
+_lock = threading.Lock()
+_config = {'pasta': 'pdfs', 'processos': 1, 'validade_horas': 24, 'max_arquivos': 50}
+
+
+def configurar_tarefas(app):
+    _config['pasta'] = app.config.get('PASTA_PDFS', os.path.join(app.root_path, 'pdfs'))
+    _config['processos'] = app.config.get('RELATORIOS_PROCESSOS', 1)
+    _config['validade_horas'] = app.config.get('RELATORIOS_VALIDADE_HORAS', 24)
+    _config['max_arquivos'] = app.config.get('RELATORIOS_MAX_ARQUIVOS', 50)
+    os.makedirs(_config['pasta'], exist_ok=True)
+
+
+def _obter_executor(recriar=False):
+    global _executor
+    if _executor is None or recriar:
+        # spawn também no Linux: não herda conexões nem locks do servidor
+        _executor = ProcessPoolExecutor(
+            max_workers=_config['processos'],
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def _descartar_concluidas():
+    # Chamada com _lock
+    for chave, tarefa in list(_tarefas.items()):
+        if tarefa.done():
+            del _tarefas[chave]
+            erro = None if tarefa.cancelled() else tarefa.exception()
+            if erro is not None:
+                _erros.set(chave, str(erro))
+
+
+def _remover_pdfs_antigos():
+    # A chave inclui a última venda: sem isto cada venda nova deixaria um PDF para sempre
+    limite = time.time() - _config['validade_horas'] * 3600
+    arquivos = sorted(
+        ((entrada.stat().st_mtime, entrada.path) for entrada in os.scandir(_config['pasta'])
+         if re.fullmatch(r'relatorio_[0-9a-f]{32}\.pdf', entrada.name)),
+        reverse=True
+    )
+    for posicao, (modificado, caminho) in enumerate(arquivos):
+        if modificado < limite or posicao >= _config['max_arquivos']:
+            try:
+                os.remove(caminho)
+            except OSError:
+                # Sendo baixado (no Windows não se apaga arquivo aberto): fica para a próxima
+                pass
+
+
+EXECUTORES = {
+    'transacoes': executar_relatorio_transacoes,
+    'fechamento': executar_relatorio_fechamento,
+}
+
+
+def chave_tarefa(tipo, parametros):
+    conteudo = json.dumps({'tipo': tipo, 'parametros': parametros}, sort_keys=True, default=str)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:32]
+
+
+def caminho_arquivo(chave):
+    return os.path.join(_config['pasta'], f'relatorio_{chave}.pdf')
+
+
+def submeter(tipo, *argumentos, parametros_chave):
+    """Enfileira a geração de um relatório e devolve o id da tarefa.
+
+    ``parametros_chave`` é o que identifica o conteúdo do relatório; se o PDF
+    com essa chave já existe em disco ou está sendo gerado, nada é refeito.
+    """
+    chave = chave_tarefa(tipo, parametros_chave)
+    destino = caminho_arquivo(chave)
+    with _lock:
+        _descartar_concluidas()
+        _remover_pdfs_antigos()
+        if os.path.exists(destino) or chave in _tarefas:
+            return chave
+        _erros.pop(chave)
+        try:
+            _tarefas[chave] = _obter_executor().submit(EXECUTORES[tipo], *argumentos, destino)
+        except BrokenProcessPool:
+            # Um processo morreu e inutilizou o pool: começa um novo
+            _tarefas[chave] = _obter_executor(recriar=True).submit(EXECUTORES[tipo], *argumentos, destino)
+    return chave
+
+
+def situacao(chave):
+    if not re.fullmatch(r'[0-9a-f]{32}', chave):
+        return None
+    destino = caminho_arquivo(chave)
+    with _lock:
+        tarefa = _tarefas.get(chave)
+
+    if tarefa is not None and tarefa.done() and tarefa.exception() is not None:
+        return {'id': chave, 'status': 'erro', 'erro': str(tarefa.exception())}
+    erro = _erros.get(chave) if tarefa is None else None
+    if erro is not None:
+        return {'id': chave, 'status': 'erro', 'erro': erro}
+    if os.path.exists(destino):
+        return {'id': chave, 'status': 'concluido', 'bytes': os.path.getsize(destino)}
+    if tarefa is None:
+        return None
+    if tarefa.running():
+        try:
+            gerados = os.path.getsize(destino + '.parcial')
+        except OSError:
+            gerados = 0
+        return {'id': chave, 'status': 'executando', 'bytes': gerados}
+    return {'id': chave, 'status': 'pendente', 'bytes': 0}
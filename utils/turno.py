@@ -0,0 +1,113 @@
+from sqlalchemy import or_, select, update
+
+from models import db, Transacao, Turno
+
+METODOS_PAGAMENTO = ('pix', 'debito', 'credito', 'dinheiro')
+
+
+def turno_aberto():
+    return Turno.query.filter(Turno.fechamento.is_(None)).first()
+
+
+def acumular_turno(transacao, quantidade_itens):
+    """Soma a venda aos contadores do turno aberto (abrindo um se não houver)
+    e liga a venda a ele.
+
+    Deve ser chamada antes do flush da venda, na mesma transação: o turno_id
+    já entra no INSERT da transação.
+    """
+    valores = {
+        'quantidade_vendas': Turno.quantidade_vendas + 1,
+        'quantidade_itens': Turno.quantidade_itens + quantidade_itens,
+    }
+    if transacao.metodo_pagamento in METODOS_PAGAMENTO:
+        coluna = getattr(Turno, f'total_{transacao.metodo_pagamento}')
+        valores[coluna.key] = coluna + transacao.valor
+
+    with db.session.no_autoflush:
+        turno_id = db.session.execute(
+            update(Turno).where(Turno.fechamento.is_(None)).values(**valores).returning(Turno.id),
+            execution_options={'synchronize_session': False}
+        ).scalar()
+    if turno_id is not None:
+        transacao.turno_id = turno_id
+    else:
+        turno = Turno(abertura=transacao.data, quantidade_vendas=1, quantidade_itens=quantidade_itens)
+        if transacao.metodo_pagamento in METODOS_PAGAMENTO:
+            setattr(turno, f'total_{transacao.metodo_pagamento}', transacao.valor)
+        db.session.add(turno)
+        transacao.turno = turno
+
+
+def fechar_turno(turno, fechamento):
+    # Marca o turno como fechado antes de ler os contadores: a partir daqui a
+    # transação segura a escrita e nenhuma venda entra entre a leitura e o fechamento
+    db.session.execute(
+        update(Turno).where(Turno.id == turno.id, Turno.fechamento.is_(None)).values(fechamento=fechamento),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.refresh(turno)
+    return {metodo: getattr(turno, f'total_{metodo}') for metodo in METODOS_PAGAMENTO}
+
+
+def consulta_totais_por_metodo(inicio, fim):
+    return _consulta_totais(Transacao.data >= inicio, Transacao.data <= fim)
+
+
+def consulta_totais_do_turno(turno_id):
+    return _consulta_totais(Transacao.turno_id == turno_id)
+
+
+def _consulta_totais(*filtros):
+    # Também usada em indices.verificar_planos, para conferir o plano da consulta real
+    return select(
+        Transacao.metodo_pagamento, db.func.sum(Transacao.valor)
+    ).where(*filtros).group_by(Transacao.metodo_pagamento)
+
+
+def _totais(consulta):
+    totais = dict.fromkeys(METODOS_PAGAMENTO, 0)
+    totais.update({
+        metodo: total or 0 for metodo, total in db.session.execute(consulta) if metodo in METODOS_PAGAMENTO
+    })
+    return totais
+
+
+def totais_por_metodo(inicio, fim):
+    return _totais(consulta_totais_por_metodo(inicio, fim))
+
+
+def totais_do_turno(turno_id):
+    return _totais(consulta_totais_do_turno(turno_id))
+
+
+def verificar_turno(turno, totais):
+    """Recalcula os totais do turno com um GROUP BY e devolve as divergências.
+
+    Soma as vendas ligadas ao turno, não as do período: venda sincronizada
+    depois com data anterior à abertura também entra. Retorna
+    ``{metodo: (contador, recalculado)}`` só para os métodos que não batem.
+    """
+    recalculados = totais_do_turno(turno.id)
+    return {
+        metodo: (totais[metodo], recalculados[metodo])
+        for metodo in METODOS_PAGAMENTO
+        if totais[metodo] != recalculados[metodo]
+    }
+
+
+def vincular_vendas_aos_turnos():
+    """Liga a um turno, pelo período, as vendas gravadas antes da coluna turno_id.
+
+    Só para a migração: as vendas novas já são ligadas em ``acumular_turno``.
+    """
+    turno = select(Turno.id).where(
+        Turno.abertura <= Transacao.data,
+        or_(Turno.fechamento.is_(None), Turno.fechamento >= Transacao.data)
+    ).order_by(Turno.id).limit(1).scalar_subquery()
+    resultado = db.session.execute(
+        update(Transacao).where(Transacao.turno_id.is_(None)).values(turno_id=turno),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    return resultado.rowcount
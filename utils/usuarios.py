@@ -0,0 +1,44 @@
+from flask_login import UserMixin
+
+from models import db, Usuario
+from utils.cache import CacheLRU
+
+# Cache do Flask-Login: o usuário da sessão é reconstruído a cada requisição
+# (a busca do PDV faz uma por tecla). Guarda só os campos usados nas telas.
+# Cada processo tem o seu cache; quem altera usuários invalida o do próprio
+# processo e o TTL limita o atraso nos demais.
+cache_usuarios = CacheLRU(tamanho_max=1000, ttl=300)
+
+
+class UsuarioSessao(UserMixin):
+    """Cópia leve do Usuario logado, sem sessão do SQLAlchemy nem hash da senha."""
+
+    def __init__(self, usuario):
+        self.id = usuario.id
+        self.usuario = usuario.usuario
+        self.nivel_acesso = usuario.nivel_acesso
+        self.is_admin = bool(usuario.is_admin)
+
+    def get_id(self):
+        return str(self.id)
+
+
+def configurar_cache_usuarios(app):
+    cache_usuarios.redimensionar(app.config.get('CACHE_USUARIOS_TAMANHO', 1000))
+    cache_usuarios.ttl = app.config.get('CACHE_USUARIOS_TTL', 300)
+
+
+def carregar_usuario(usuario_id):
+    usuario_id = int(usuario_id)
+    sessao = cache_usuarios.get(usuario_id)
+    if sessao is None:
+        usuario = db.session.get(Usuario, usuario_id)
+        if usuario is None:
+            return None
+        sessao = UsuarioSessao(usuario)
+        cache_usuarios.set(usuario_id, sessao)
+    return sessao
+
+
+def invalidar_usuario(usuario_id):
+    cache_usuarios.pop(int(usuario_id))
@@ -0,0 +1,209 @@
+from collections import OrderedDict
+from datetime import datetime
+import random
+import time
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
+
+from models import db, Produto, Transacao, ItemTransacao
+from utils.catalogo import invalidar_produto
+from utils.dinheiro import para_decimal
+from utils.estoque import baixar_estoque_venda
+from utils.historico import invalidar_totais
+from utils.idempotencia import chave_repetida, gravar_resposta
+from utils.resumos import acumular_venda
+from utils.turno import METODOS_PAGAMENTO, acumular_turno
+
+
+class VendaInvalida(ValueError):
+    pass
+
+
+class EstoqueInsuficiente(VendaInvalida):
+    pass
+
+
+class ConflitoVenda(VendaInvalida):
+    pass
+
+
+class ChaveRepetida(ConflitoVenda):
+    pass
+
+
+class PrecoDivergente(VendaInvalida):
+    pass
+
+
+TENTATIVAS_VENDA = 3
+ESPERA_CONFLITO = 0.01  # segundos; dobra a cada tentativa, com jitter
+
+
+def _quantidade(valor):
+    # 2 e '2' servem; 1.5, '1.5' e true não
+    if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+        raise VendaInvalida('Quantidade inválida no carrinho!')
+    try:
+        quantidade = int(valor)
+    except (TypeError, ValueError):
+        raise VendaInvalida('Quantidade inválida no carrinho!')
+    if quantidade <= 0:
+        raise VendaInvalida('Quantidade inválida no carrinho!')
+    return quantidade
+
+
+def _agrupar_quantidades(carrinho):
+    # Soma as quantidades por produto (o mesmo produto pode vir em mais de uma linha)
+    quantidades = OrderedDict()
+    for item in carrinho:
+        quantidades[item['id']] = quantidades.get(item['id'], 0) + item['quantidade']
+    return quantidades
+
+
+def preparar_carrinho(carrinho):
+    """Valida o carrinho e devolve ``(carrinho, quantidades)``.
+
+    O carrinho devolvido é uma cópia já convertida: ids e quantidades
+    inteiros e preços em Decimal exato (chegam como float do JSON).
+    """
+    if not carrinho:
+        raise VendaInvalida('Carrinho vazio!')
+    try:
+        carrinho = [
+            dict(item, id=int(item['id']), quantidade=_quantidade(item['quantidade']), preco=para_decimal(item['preco']))
+            for item in carrinho
+        ]
+    except VendaInvalida:
+        raise
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        raise VendaInvalida('Carrinho inválido!')
+    if any(item['preco'] is None or not item['preco'].is_finite() or item['preco'] < 0 for item in carrinho):
+        raise VendaInvalida('Preço inválido no carrinho!')
+    return carrinho, _agrupar_quantidades(carrinho)
+
+
+def conferir_pagamento(carrinho, pagamento, valor_recebido):
+    if pagamento not in METODOS_PAGAMENTO:
+        raise VendaInvalida(f"Forma de pagamento inválida! Use {', '.join(METODOS_PAGAMENTO)}.")
+    carrinho, _ = preparar_carrinho(carrinho)
+    total = sum(item['preco'] * item['quantidade'] for item in carrinho)
+    try:
+        recebido = para_decimal(valor_recebido or 0)
+    except (TypeError, ValueError, ArithmeticError):
+        raise VendaInvalida('Valor recebido inválido!')
+    if pagamento == 'dinheiro' and recebido < total:
+        raise VendaInvalida('Valor recebido insuficiente!')
+    return total
+
+
+def gravar_venda(carrinho, quantidades, pagamento, data=None, conferir_precos=True):
+    """Grava a venda na transação corrente, sem commit.
+
+    Com ``conferir_precos``, cada preço do carrinho tem que ser o do cadastro
+    (o PDV pode estar com o catálogo desatualizado); venda offline, já feita
+    e paga no terminal, grava o preço cobrado. Retorna ``(transacao_id, codigos)``, onde ``codigos`` mapeia os produtos
+    vendidos aos seus códigos de barras (para invalidar o cache depois do commit).
+    """
+    produtos = {
+        p.id: p for p in Produto.query.options(undefer(Produto.estoque_disponivel))
+        .filter(Produto.id.in_(quantidades)).all()
+    }
+    for produto_id, quantidade in quantidades.items():
+        produto = produtos.get(produto_id)
+        if produto is None:
+            raise VendaInvalida(f'Produto {produto_id} não encontrado!')
+        if produto.estoque_disponivel < quantidade:
+            raise EstoqueInsuficiente(f'Estoque insuficiente para {produto.nome}!')
+    if conferir_precos:
+        for item in carrinho:
+            produto = produtos[item['id']]
+            if item['preco'] != produto.preco:
+                raise PrecoDivergente(f'O preço de {produto.nome} mudou para R$ {produto.preco}. Atualize o carrinho.')
+
+    # Guardados antes do commit, que expira os objetos carregados
+    codigos = {pid: produtos[pid].codigo_barras for pid in quantidades}
+    categorias = {pid: produtos[pid].categoria_id for pid in quantidades}
+    versoes = {pid: produtos[pid].versao for pid in quantidades}
+
+    transacao = Transacao(
+        data=data or datetime.now(),
+        valor=sum(item['preco'] * item['quantidade'] for item in carrinho),
+        metodo_pagamento=pagamento
+    )
+    for item in carrinho:
+        transacao.itens.append(ItemTransacao(
+            produto_id=item['id'],
+            quantidade=item['quantidade'],
+            preco=item['preco']
+        ))
+    db.session.add(transacao)
+    acumular_turno(transacao, sum(quantidades.values()))
+    db.session.flush()
+
+    # Outro caixa pode ter vendido o mesmo produto, ou alguém editado o
+    # produto, entre a leitura e a baixa
+    if not baixar_estoque_venda(quantidades, versoes, transacao.id, transacao.data):
+        raise ConflitoVenda('Um dos produtos do carrinho foi alterado durante a venda. Tente novamente.')
+
+    acumular_venda(transacao, carrinho, categorias)
+    return transacao.id, codigos
+
+
+def esperar_nova_tentativa(tentativa):
+    time.sleep(random.uniform(0, ESPERA_CONFLITO * 2 ** tentativa))
+
+
+def invalidar_caches_venda(codigos):
+    for produto_id, codigo_barras in codigos.items():
+        invalidar_produto(produto_id, codigo_barras)
+    invalidar_totais()
+
+
+def resposta_venda(transacao_id):
+    return {'status': 'success', 'message': 'Compra finalizada com sucesso!', 'transacao_id': transacao_id}
+
+
+def registrar_venda(carrinho, pagamento, chave=None):
+    """Registra a venda do carrinho em uma única transação do banco.
+
+    Carrega todos os produtos com uma só consulta, grava a Transacao com
+    todos os seus itens e lança as saídas no livro de estoque com um INSERT
+    condicional (só entra se o produto continua na versão lida e o saldo
+    disponível cobre a quantidade), tudo em um único commit. Em caso de erro
+    nada é gravado.
+
+    Se outro terminal mexeu nos produtos entre a leitura e a gravação, a venda
+    é refeita com dados novos até ``TENTATIVAS_VENDA`` vezes; na nova leitura
+    ou ela passa, ou falha com EstoqueInsuficiente.
+
+    Com ``chave`` (de idempotência), a resposta da venda é gravada no mesmo
+    commit; se outro envio com a mesma chave gravou primeiro, nada é gravado
+    e sobe ChaveRepetida.
+    Retorna o id da transação criada.
+    """
+    carrinho, quantidades = preparar_carrinho(carrinho)
+
+    for tentativa in range(1, TENTATIVAS_VENDA + 1):
+        try:
+            transacao_id, codigos = gravar_venda(carrinho, quantidades, pagamento)
+            if chave:
+                gravar_resposta(chave, 200, resposta_venda(transacao_id))
+            db.session.commit()
+            break
+        except IntegrityError as e:
+            db.session.rollback()
+            if chave and chave_repetida(e):
+                raise ChaveRepetida('Esta venda já foi enviada.')
+            raise
+        except ConflitoVenda:
+            db.session.rollback()
+            if tentativa == TENTATIVAS_VENDA:
+                raise
+            esperar_nova_tentativa(tentativa)
+        except Exception:
+            db.session.rollback()
+            raise
+
+    invalidar_caches_venda(codigos)
+    return transacao_id